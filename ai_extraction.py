@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional, TypedDict
+from google.genai import types
+from gemini_pool import key_pool, KeyPoolExhausted
+from ocr_cache import ocr_cache
+from image_prep import prepare_images, crop_band
+from matching import normalize_strict
+
+# Single entry point for every Gemini screenshot extraction.
+# Model selection, key scheduling, caching, preprocessing and JSON parsing live here;
+# cogs only deal with the parsed rows.
+
+# Seconds a single model call may take before it's cancelled
+AI_TIMEOUT = int(os.getenv("AI_TIMEOUT", "90"))
+
+# Fallback to 2.5 Flash as Pro models are rate-limited for this user.
+PREFERRED_MODEL = 'models/gemini-2.5-flash'
+
+MATCH_PROMPT = """
+You are an official Esports Referee. Your job is to DIGITIZE this Free Fire results screenshot with 100% precision.
+
+INSTRUCTIONS:
+1. Read the scoreboard ROW by ROW.
+2. Verify columns: Rank (#), Player Name (IGN), Eliminations/Kills.
+3. Ignore "Assists", "Damage", or "Total Points" columns if present. Focus ONLY on Kills.
+4. CRITICAL: Distinguish between "Total Kills" (Team Kills) and "Individual Kills".
+   - Usually, the Team Header shows Total Kills.
+   - The rows below it show Individual Kills.
+   - ONLY extract the INDIVIDUAL Kills.
+
+OUTPUT FORMAT (one entry per SQUAD, in rank order):
+[
+  {"position": 1, "team_name": "TeamA", "image": 0, "box_2d": [120, 0, 210, 1000], "players": [{"ign": "Player1", "kills": 5}, {"ign": "Player2", "kills": 2}]},
+  {"position": 2, "team_name": "TeamB", "image": 0, "box_2d": [215, 0, 300, 1000], "players": [{"ign": "EnemyX", "kills": 0}]}
+]
+
+RULES:
+- "position": The Rank of the TEAM (1, 2, 3...).
+- "team_name": As shown on the scoreboard, or null if not shown.
+- "ign": Exact spelling, case-sensitive. Capture special characters if possible.
+- "kills": Must be a number.
+- List every player of the squad under "players".
+- Do not hallucinate players not in the image.
+- "image": 0-based index of the screenshot the squad appears on.
+- "box_2d": [ymin, xmin, ymax, xmax] of the squad's rows on that screenshot, scaled 0-1000.
+"""
+
+# Used by the "Re-scan" button: one crop around a single squad
+RESCAN_PROMPT = """
+This is a crop of a Free Fire results screenshot around the squad ranked #{position}.
+Extract ONLY that squad: every player's exact IGN and INDIVIDUAL kills (not team total).
+Use the same format as usual: [{{"position": {position}, "team_name": "...", "players": [{{"ign": "...", "kills": 0}}]}}]
+Rows of other squads may be partially visible at the edges; ignore them.
+"""
+
+# Structured-output schemas: the model is constrained to these shapes, so replies are
+# valid JSON by construction. Squad-grouped to avoid repeating position/team per player.
+MATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "position": {"type": "INTEGER"},
+            "team_name": {"type": "STRING", "nullable": True},
+            "image": {"type": "INTEGER"},
+            "box_2d": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+            "players": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "ign": {"type": "STRING"},
+                        "kills": {"type": "INTEGER"}
+                    },
+                    "required": ["ign", "kills"]
+                }
+            }
+        },
+        "required": ["position", "players"]
+    }
+}
+
+LOBBY_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "slot": {"type": "INTEGER"},
+            "igns": {"type": "ARRAY", "items": {"type": "STRING"}}
+        },
+        "required": ["slot", "igns"]
+    }
+}
+
+LOBBY_PROMPT = """
+Analyze these Free Fire custom room lobby screenshots (combined).
+Extract the SLOT NUMBER and the PLAYER IGN (In-Game Name) for every player visible across ALL images.
+
+Rules:
+- The slot number is usually on the left or part of the box (1, 2, 3.. 12).
+- Ignore "Spectators" or non-player slots.
+- Return one entry per slot: [{"slot": 1, "igns": ["Name", "Name2"]}]
+- If a slot has multiple players, list them all under that slot.
+- Be precise with IGNs.
+"""
+
+class PlayerRow(TypedDict, total=False):
+    ign: str
+    kills: int
+    position: int
+    team_name: Optional[str]
+    img_idx: int # screenshot the squad was read from
+    box: Optional[List[int]] # squad's [ymin, xmin, ymax, xmax] on that screenshot, 0-1000
+
+class LobbyRow(TypedDict):
+    slot: int
+    ign: str
+
+@dataclass
+class ExtractionResult:
+    rows: List[dict] = field(default_factory=list)
+    model: str = ""
+    cached: bool = False
+    elapsed: float = 0.0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+class ExtractionError(Exception):
+    """The model answered but no usable JSON could be read from it, or the call timed out."""
+
+_model_name = None
+_model_lock = asyncio.Lock()
+
+def _pick_model(available_models):
+    if PREFERRED_MODEL in available_models:
+        return PREFERRED_MODEL
+    print(f"⚠️ {PREFERRED_MODEL} not found! Checking alternatives...")
+    # Fallback priority: 1.5 Pro -> 2.0 Flash Exp -> any Flash
+    if 'models/gemini-1.5-pro-latest' in available_models:
+        return 'models/gemini-1.5-pro-latest'
+    for needle in ('gemini-2.0-flash', 'flash'):
+        match = next((m for m in available_models if needle in m), None)
+        if match: return match
+    return PREFERRED_MODEL
+
+async def get_model_name():
+    """Resolves the model once (listing models runs in a thread, not on the event loop)."""
+    global _model_name
+    if _model_name: return _model_name
+    async with _model_lock:
+        if not _model_name:
+            try:
+                client = key_pool.default_client
+                available_models = await asyncio.to_thread(lambda: [m.name for m in client.models.list()])
+                _model_name = _pick_model(available_models)
+            except Exception as e:
+                print(f"⚠️ Error listing models: {e}")
+                _model_name = PREFERRED_MODEL
+            print(f"🤖 Selected AI Model: {_model_name}")
+    return _model_name
+
+def parse_json_list(text):
+    """
+    Pulls the first JSON array out of a model reply. Handles ``` fences, prose around
+    the JSON and brackets inside IGNs; a bare object is wrapped into a list.
+    """
+    if not text:
+        raise ExtractionError("AI returned an empty response.")
+    cleaned = text.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict): data = [data]
+        if isinstance(data, list): return data
+    except json.JSONDecodeError:
+        pass
+    # Scan for the first array of objects (skips things like "[1]" in surrounding prose)
+    decoder = json.JSONDecoder()
+    empty_found = False
+    start = cleaned.find("[")
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(cleaned, start)
+            if isinstance(data, list):
+                if data and all(isinstance(r, dict) for r in data): return data
+                if not data: empty_found = True
+        except json.JSONDecodeError:
+            pass
+        start = cleaned.find("[", start + 1)
+    if empty_found: return []
+    raise ExtractionError("AI failed to find structured data.")
+
+def flatten_squads(squads):
+    """[{position, team_name, image, box_2d, players: [{ign, kills}]}] -> [{ign, kills, position, team_name, img_idx, box}] (PlayerRow)."""
+    rows = []
+    for squad in squads:
+        box = squad.get("box_2d")
+        if not (isinstance(box, list) and len(box) == 4): box = None
+        for player in squad.get("players") or []:
+            if not isinstance(player, dict): continue
+            rows.append({
+                "ign": player.get("ign"),
+                "kills": player.get("kills", 0),
+                "position": squad.get("position"),
+                "team_name": squad.get("team_name"),
+                "img_idx": squad.get("image") or 0,
+                "box": box
+            })
+    return rows
+
+def flatten_slots(slots):
+    """[{slot, igns: [...]}] -> [{slot, ign}] (LobbyRow)."""
+    return [{"slot": entry.get("slot"), "ign": ign} for entry in slots for ign in (entry.get("igns") or [])]
+
+async def _call_model(model, prompt, prepared, schema):
+    """One structured-output call. Returns (list of dicts, tokens in, tokens out)."""
+    content_parts = [prompt] + [types.Part.from_bytes(data=d, mime_type=mt) for d, mt in prepared]
+    config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
+    try:
+        # Key pool picks the least loaded key that still has quota; wait_for cancels the call on timeout
+        response = await asyncio.wait_for(key_pool.generate_content(model, content_parts, config=config), timeout=AI_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ExtractionError(f"AI did not answer within {AI_TIMEOUT}s.")
+
+    # Schema mode returns plain JSON; parse_json_list only matters if the model ignores it
+    try:
+        groups = json.loads(response.text)
+        if isinstance(groups, dict): groups = [groups]
+        if not isinstance(groups, list): raise TypeError
+    except (TypeError, json.JSONDecodeError):
+        groups = parse_json_list(response.text)
+    usage = getattr(response, "usage_metadata", None)
+    tokens_in = (usage.prompt_token_count or 0) if usage else 0
+    tokens_out = (usage.candidates_token_count or 0) if usage else 0
+    return [g for g in groups if isinstance(g, dict)], tokens_in, tokens_out
+
+async def _extract(images, prompt, kind, schema, flatten):
+    """
+    images: [(bytes, mime_type), ...] as downloaded
+    Returns ExtractionResult with the parsed list of dicts.
+    """
+    start = time.perf_counter()
+    model = await get_model_name()
+
+    cache_key = await asyncio.to_thread(ocr_cache.make_key, [d for d, _ in images], prompt, model)
+    rows = await ocr_cache.get(cache_key)
+    if rows is not None:
+        print(f"[AI] OCR cache hit ({cache_key[:12]})")
+        return ExtractionResult(rows=rows, model=model, cached=True, elapsed=time.perf_counter() - start)
+
+    # Crop / downscale / re-encode off the event loop before upload
+    prepared = await prepare_images(images, kind=kind)
+    groups, tokens_in, tokens_out = await _call_model(model, prompt, prepared, schema)
+    rows = [r for r in flatten(groups) if r.get("ign")]
+    # An empty read may be a one-off model failure; don't pin it for retries
+    if rows: await ocr_cache.put(cache_key, rows)
+    elapsed = time.perf_counter() - start
+    print(f"[AI] {kind} extraction ({len(images)} image(s)): {len(rows)} rows in {elapsed:.1f}s, {tokens_in} in / {tokens_out} out tokens")
+    return ExtractionResult(rows=rows, model=model, cached=False, elapsed=elapsed, tokens_in=tokens_in, tokens_out=tokens_out)
+
+def merge_fan_out(partials):
+    """
+    Merges per-screenshot rows. A player seen on more than one screenshot (same position
+    and normalized IGN) is kept once, with the higher kill count. Duplicates inside a
+    single screenshot are left alone, same as batched mode.
+    """
+    merged = []
+    seen = {} # (position, ign key) -> merged row
+    for img_idx, rows in enumerate(partials):
+        keys_this_image = set()
+        for row in rows:
+            key = (row.get("position"), normalize_strict(row.get("ign")) or str(row.get("ign")).lower())
+            existing = seen.get(key)
+            if existing is not None and key not in keys_this_image:
+                try:
+                    existing["kills"] = max(int(existing.get("kills") or 0), int(row.get("kills") or 0))
+                except (TypeError, ValueError):
+                    pass
+                if not existing.get("team_name"): existing["team_name"] = row.get("team_name")
+                continue
+            row = dict(row, img_idx=img_idx)
+            merged.append(row)
+            seen.setdefault(key, row)
+            keys_this_image.add(key)
+    return merged
+
+async def extract_match_results(images, fan_out=False) -> ExtractionResult:
+    """
+    Results screenshots -> rows of PlayerRow.
+    fan_out: extract each screenshot in its own concurrent call (spread over the key pool)
+    and merge, instead of one call with every screenshot.
+    """
+
+    if not fan_out or len(images) < 2:
+        return await _extract(images, MATCH_PROMPT, "results", MATCH_SCHEMA, flatten_squads)
+
+    start = time.perf_counter()
+    partials = await asyncio.gather(*(_extract([img], MATCH_PROMPT, "results", MATCH_SCHEMA, flatten_squads) for img in images))
+    rows = merge_fan_out([p.rows for p in partials])
+    result = ExtractionResult(
+        rows=rows,
+        model=partials[0].model,
+        cached=all(p.cached for p in partials),
+        elapsed=time.perf_counter() - start,
+        tokens_in=sum(p.tokens_in for p in partials),
+        tokens_out=sum(p.tokens_out for p in partials)
+    )
+    print(f"[AI] results fan-out ({len(images)} calls): {len(rows)} rows in {result.elapsed:.1f}s, {result.tokens_in} in / {result.tokens_out} out tokens")
+    return result
+
+def estimate_band(position, bands):
+    """
+    Vertical band (top, bottom as 0-1 fractions) of a squad on its screenshot.
+    bands: {position: (top, bottom)} of squads already located on the same screenshot.
+    Uses the squad's own box if known, otherwise the gap between its neighbours.
+    Returns None when nothing on the screenshot was located.
+    """
+    if position in bands: return bands[position]
+    if not bands: return None
+    heights = [b - t for t, b in bands.values() if b > t]
+    row_h = sum(heights) / len(heights) if heights else 0.1
+    above = max((p for p in bands if p < position), default=None)
+    below = min((p for p in bands if p > position), default=None)
+    if above is not None and below is not None:
+        top, bottom = bands[above][1], bands[below][0]
+    elif above is not None:
+        top = bands[above][1] + row_h * (position - above - 1)
+        bottom = top + row_h
+    else:
+        bottom = bands[below][0] - row_h * (below - position - 1)
+        top = bottom - row_h
+    if top >= 1.0 or bottom <= 0.0: return None # off this screenshot; send it whole
+    return max(0.0, top), min(1.0, max(bottom, top + row_h))
+
+async def rescan_position(images, position, img_idx=0, band=None) -> ExtractionResult:
+    """
+    Re-reads a single squad. Only a crop of one screenshot is uploaded (the full
+    screenshot if the squad's band is unknown). Returns PlayerRow rows for that position.
+    """
+    start = time.perf_counter()
+    model = await get_model_name()
+    if not images:
+        raise ExtractionError("No screenshot available to re-scan.")
+    img_idx = min(max(img_idx, 0), len(images) - 1)
+    # Same frame the boxes were measured on (_prepare_geometry; results are never tiled)
+    data, mime = (await prepare_images([images[img_idx]], kind="results"))[0]
+    if band:
+        data, mime = await asyncio.to_thread(crop_band, data, band[0], band[1]), "image/jpeg"
+
+    prompt = RESCAN_PROMPT.format(position=position)
+    cache_key = await asyncio.to_thread(ocr_cache.make_key, [data], prompt, model)
+    rows = await ocr_cache.get(cache_key)
+    cached = rows is not None
+    tokens_in = tokens_out = 0
+    if not cached:
+        groups, tokens_in, tokens_out = await _call_model(model, prompt, [(data, mime)], MATCH_SCHEMA)
+        # The crop can catch neighbouring squads; keep the requested one (or the only one)
+        wanted = [g for g in groups if g.get("position") == position] or (groups if len(groups) == 1 else [])
+        rows = [dict(r, position=position, img_idx=img_idx, box=None) for r in flatten_squads(wanted) if r.get("ign")]
+        if rows: await ocr_cache.put(cache_key, rows)
+    elapsed = time.perf_counter() - start
+    print(f"[AI] re-scan position {position} ({len(data) / 1024:.0f} KB crop): {len(rows)} rows in {elapsed:.1f}s, {tokens_in} in / {tokens_out} out tokens")
+    return ExtractionResult(rows=rows, model=model, cached=cached, elapsed=elapsed, tokens_in=tokens_in, tokens_out=tokens_out)
+
+async def extract_lobby_slots(images) -> ExtractionResult:
+    """Lobby screenshots -> rows of LobbyRow."""
+    return await _extract(images, LOBBY_PROMPT, "lobby", LOBBY_SCHEMA, flatten_slots)
@@ -0,0 +1,27 @@
+import sys
+import asyncio
+import mimetypes
+import tempfile
+
+# Compares batched vs fan-out results extraction on the same screenshots.
+# Usage: python bench_ocr.py shot1.png shot2.png [shot3.png]
+# Every mode gets its own empty OCR cache, so each one really calls the API.
+from ai_extraction import extract_match_results
+from ocr_cache import ocr_cache
+
+async def main(paths):
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((f.read(), mimetypes.guess_type(path)[0] or "image/png"))
+
+    for label, fan_out in (("batch", False), ("fanout", True)):
+        ocr_cache.directory = tempfile.mkdtemp(prefix=f"ocr_bench_{label}_")
+        r = await extract_match_results(images, fan_out=fan_out)
+        print(f"{label:>7}: {len(r.rows)} rows, {r.elapsed:.1f}s, {r.tokens_in} in / {r.tokens_out} out tokens")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python bench_ocr.py shot1.png shot2.png [shot3.png]")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,114 @@
+import sys
+import time
+import random
+import string
+import difflib
+from matching import FuzzyMatcher, normalize_strict
+
+# Regression corpus for matching.FuzzyMatcher: OCR-style corruptions of a seeded
+# random IGN registry, matched with FuzzyMatcher and with the difflib scan it
+# replaced. Fails (exit 1) if FuzzyMatcher gets fewer right or more wrong.
+# Usage: python check_matching.py [registry_size] [queries] [seed]
+
+PREFIXES = ["", "", "", "TSM", "GXR", "NG", "ELITE", "OP", "XO", "FF", "TG", "IND"]
+SEPARATORS = ["", " ", "_", ".", "|", "-", "•"]
+WORDS = ["shadow", "killer", "ghost", "raider", "ninja", "viper", "hunter", "blaze", "storm", "rex",
+         "sniper", "alpha", "omega", "king", "queen", "ace", "demon", "legend", "wolf", "hawk",
+         "titan", "fury", "zero", "nova", "spark", "venom", "rage", "pro", "boss", "jack"]
+# Confusions seen in Free Fire scoreboard reads
+OCR_SWAPS = {"o": "0", "0": "o", "i": "1", "1": "l", "l": "i", "s": "5", "5": "s", "b": "8", "e": "c",
+             "a": "4", "g": "9", "z": "2", "m": "rn", "rn": "m", "w": "vv", "u": "v"}
+
+def make_name(rng):
+    word = rng.choice(WORDS) + (rng.choice(WORDS) if rng.random() < 0.4 else "")
+    if rng.random() < 0.5: word = word.capitalize()
+    if rng.random() < 0.5: word += str(rng.randint(1, 999))
+    prefix = rng.choice(PREFIXES)
+    return f"{prefix}{rng.choice(SEPARATORS)}{word}" if prefix else word
+
+def corrupt(name, rng):
+    text = name
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.random()
+        if kind < 0.45:
+            # Character confusion
+            spots = [k for k in OCR_SWAPS if k in text.lower()]
+            if spots:
+                k = rng.choice(spots)
+                i = text.lower().index(k)
+                text = text[:i] + OCR_SWAPS[k] + text[i + len(k):]
+        elif kind < 0.6 and len(text) > 4:
+            # Dropped character
+            i = rng.randrange(len(text))
+            text = text[:i] + text[i + 1:]
+        elif kind < 0.75:
+            # Clan tag / separator lost or misread
+            text = text.replace(rng.choice(SEPARATORS[1:]), rng.choice(SEPARATORS))
+        elif kind < 0.85 and len(text) > 6:
+            # Clipped at the column edge
+            text = text[:-rng.randint(1, 2)]
+        else:
+            # Stray glyph
+            i = rng.randrange(len(text) + 1)
+            text = text[:i] + rng.choice(string.ascii_letters + string.digits) + text[i:]
+    return text
+
+def difflib_best_match(target, candidates, cutoff=0.8):
+    # The linear scan FuzzyMatcher replaced (MatchConfirmationView.confirm)
+    target_strict = normalize_strict(target)
+    best_match = None
+    best_score = 0
+    if len(target_strict) < 3: return None
+
+    for cand_id, cand_ign in candidates:
+        cand_strict = normalize_strict(cand_ign)
+        if not cand_strict: continue
+        score = difflib.SequenceMatcher(None, target_strict, cand_strict).ratio()
+        if len(cand_strict) > 3 and (target_strict in cand_strict or cand_strict in target_strict):
+            score = max(score, 0.9)
+        if score > best_score and score >= cutoff:
+            best_score = score
+            best_match = (cand_id, cand_ign)
+    return best_match[0] if best_match else None
+
+def score(picks, truth):
+    right = sum(1 for p, t in zip(picks, truth) if p == t)
+    missed = sum(1 for p in picks if p is None)
+    return right, len(picks) - right - missed, missed
+
+def main(registry_size=5000, queries=400, seed=7):
+    rng = random.Random(seed)
+    registry = []
+    seen = set()
+    while len(registry) < registry_size:
+        # Unique after normalization, otherwise a "wrong" pick may just be a twin
+        name = make_name(rng)
+        if normalize_strict(name) in seen: continue
+        seen.add(normalize_strict(name))
+        registry.append((len(registry), name))
+    truth = [rng.randrange(registry_size) for _ in range(queries)]
+    targets = [corrupt(registry[i][1], rng) for i in truth]
+
+    ok = True
+    for cutoff in (0.7, 0.8): # team names, IGNs
+        start = time.perf_counter()
+        old = [difflib_best_match(t, registry, cutoff) for t in targets]
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = FuzzyMatcher(registry)
+        new = [matcher.best_match(t, cutoff) for t in targets]
+        new_time = time.perf_counter() - start
+
+        old_score, new_score = score(old, truth), score(new, truth)
+        for label, (right, wrong, missed), elapsed in (("difflib", old_score, old_time), ("fuzzy", new_score, new_time)):
+            print(f"cutoff {cutoff} {label:>7}: {right} right, {wrong} wrong, {missed} missed, {elapsed:.2f}s")
+        print(f"cutoff {cutoff}: {sum(1 for a, b in zip(old, new) if a != b)} picks differ")
+        if new_score[0] < old_score[0] or new_score[1] > old_score[1]:
+            print(f"❌ FuzzyMatcher is worse than difflib at cutoff {cutoff}")
+            ok = False
+    return ok
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    sys.exit(0 if main(*args) else 1)
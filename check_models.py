@@ -1,13 +1,13 @@
-import google.generativeai as genai
+from google import genai
 from config import GEMINI_API_KEY
 import os
 
-genai.configure(api_key=GEMINI_API_KEY)
+client = genai.Client(api_key=GEMINI_API_KEY)
 
 print("Listing available models...")
 try:
-    for m in genai.list_models():
-        if 'generateContent' in m.supported_generation_methods:
+    for m in client.models.list():
+        if 'generateContent' in (m.supported_actions or []):
             print(f"- {m.name}")
 except Exception as e:
     print(f"Error: {e}")
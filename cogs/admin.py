@@ -2,6 +2,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from database import db
+from view_registry import view_registry
+from logo_cache import logo_cache
 
 class Admin(commands.Cog):
     def __init__(self, bot):
@@ -21,7 +23,7 @@ class Admin(commands.Cog):
         results_id = str(results_channel.id)
 
         # Use DB Manager
-        db.upsert_config(guild_id, role_id, staff_id, results_id)
+        await db.upsert_config(guild_id, role_id, staff_id, results_id)
 
         embed = discord.Embed(
             title="✅ Setup Complete",
@@ -63,7 +65,7 @@ class Admin(commands.Cog):
 
             try:
                 # 1. Get Staff Channel (to proxy the image)
-                config = db.get_config(guild_id)
+                config = await db.get_config(guild_id)
                 staff_channel_id = config[3] if config else None
                 
                 logo_url_to_save = logo.url # Default to temp url
@@ -78,20 +80,35 @@ class Admin(commands.Cog):
                          msg += "\n✅ Logo proxied to staff channel for permanent hosting."
                 
                 # 2. Save URL to Database
-                db.update_branding(guild_id, host_name, logo_url_to_save)
+                await db.update_branding(guild_id, host_name, logo_url_to_save)
                 msg += "\n✅ Logo URL saved to database!"
+
+                # 3. Cache it now, while the attachment URL is fresh (renders never download)
+                if await logo_cache.fetch(self.bot.http_session, logo_url_to_save, force=True) is None:
+                    msg += "\n⚠️ Could not download the logo; it will be retried on the next points table."
                 
             except Exception as e:
                 msg += f"\n❌ Error saving logo: {e}"
                 # Still try to save name if logo failed
-                db.update_branding(guild_id, host_name)
+                await db.update_branding(guild_id, host_name)
 
         else:
              # Just update name
-             db.update_branding(guild_id, host_name)
+             await db.update_branding(guild_id, host_name)
 
         await interaction.followup.send(msg)
 
+    @app_commands.command(name="set_ocr_mode", description="Choose how match screenshots are read by the AI")
+    @app_commands.describe(mode="Batch: one AI call for all screenshots. Fan-out: one call per screenshot, in parallel.")
+    @app_commands.choices(mode=[
+        app_commands.Choice(name="Batch (fewer requests)", value="batch"),
+        app_commands.Choice(name="Fan-out (faster with several API keys)", value="fanout")
+    ])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def set_ocr_mode(self, interaction: discord.Interaction, mode: app_commands.Choice[str]):
+        await db.update_ocr_mode(str(interaction.guild.id), mode.value)
+        await interaction.response.send_message(f"✅ OCR mode set to **{mode.name}**.", ephemeral=True)
+
     # --- PREFIX COMMANDS FOR ADMIN UTILITIES ---
 
     @commands.command()
@@ -101,6 +118,13 @@ class Admin(commands.Cog):
         synced = await self.bot.tree.sync()
         await ctx.send(f"✅ Globally synced {len(synced)} commands. (Note: Global sync can take up to 1 hour to reflect everywhere).")
 
+    @commands.command()
+    @commands.is_owner()
+    async def pending_views(self, ctx):
+        """Shows how many match confirmations are waiting and the memory they hold."""
+        live, retained = view_registry.gauge()
+        await ctx.send(f"📋 {live} pending confirmation(s) across {len(view_registry.guilds)} server(s), ~{retained / 1024:.0f} KB retained.")
+
     @commands.command()
     async def sync_guild(self, ctx):
         """Syncs commands to the current guild only (Instant refresh). Usage: !sync_guild"""
@@ -1,42 +1,18 @@
-import asyncio
 import discord
 from discord import app_commands
-from discord.ext import commands
-import json
-import google.generativeai as genai
-from config import GEMINI_API_KEY
+from discord.ext import commands, tasks
+from ai_extraction import extract_match_results, rescan_position, estimate_band, ExtractionError, KeyPoolExhausted
 from database import db
-from utils import is_scrim_admin, get_config
-import aiohttp
+from utils import is_scrim_admin, get_config, download_attachments, download_urls, AttachmentDownloadError
+from matching import get_roster_index, FuzzyMatcher
+from player_registry import player_registry, PLAYERS_FULL_SYNC_INTERVAL
+from job_queue import submission_queue, QueueFull
+from pending_store import pending_store
+from view_registry import view_registry
 import io
-import re
-import difflib
+import time
 from collections import defaultdict, Counter
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Dynamic Model Selection
-# Fallback to 2.5 Flash as Pro models are rate-limited for this user.
-target_model_name = 'models/gemini-2.5-flash'
-
-try:
-    available_models = [m.name for m in genai.list_models()]
-    if target_model_name not in available_models:
-        print(f"⚠️ {target_model_name} not found! Checking alternatives...")
-        # Fallback priority: 1.5 Pro -> 2.0 Flash Exp -> 1.5 Flash
-        if 'models/gemini-1.5-pro-latest' in available_models:
-             target_model_name = 'models/gemini-1.5-pro-latest'
-        elif any('gemini-2.0-flash' in m for m in available_models):
-             target_model_name = next(m for m in available_models if 'gemini-2.0-flash' in m)
-        elif any('flash' in m for m in available_models):
-             target_model_name = next(m for m in available_models if 'flash' in m)
-except Exception as e:
-    print(f"⚠️ Error listing models: {e}")
-
-print(f"🤖 Selected AI Model: {target_model_name}")
-model = genai.GenerativeModel(target_model_name)
-
 class ResultValidator:
     """
     Advanced Logic to clean up AI OCR hallucinations and enforce game rules.
@@ -86,16 +62,64 @@ class ResultValidator:
         return cleaned_data
 
 class MatchConfirmationView(discord.ui.View):
-    def __init__(self, lobby_id, match_no, stats_data, admin_id, existing_match_id=None):
+    def __init__(self, lobby_id, match_no, stats_data, admin_id, existing_match_id=None, images=None, image_urls=None):
         super().__init__(timeout=None)
         self.lobby_id = lobby_id
         self.match_no = match_no
         self.stats_data = stats_data 
         self.admin_id = admin_id
         self.existing_match_id = existing_match_id
-
-
-    @discord.ui.button(label="Confirm & Save", style=discord.ButtonStyle.green)
+        self.images = images or [] # downloaded screenshots [(bytes, mime_type)], for re-scans
+        self.image_urls = image_urls or [] # to re-download them after a restart
+        # Set once the confirmation message is sent (see attach)
+        self.message_id = None
+        self.channel_id = None
+        self.guild_id = None
+        self.created_at = None
+
+    # --- Persistence (survives restarts, see pending_store.py) ---
+
+    def attach(self, message):
+        """Binds the view to its sent message and persists it."""
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id if message.guild else None
+        self.created_at = time.time()
+        self.persist()
+        view_registry.register(self)
+
+    def persist(self):
+        if not self.message_id: return
+        pending_store.save({
+            "message_id": self.message_id, "channel_id": self.channel_id, "guild_id": self.guild_id,
+            "lobby_id": self.lobby_id, "match_no": self.match_no, "admin_id": self.admin_id,
+            "existing_match_id": self.existing_match_id, "stats_data": self.stats_data,
+            "image_urls": self.image_urls, "created_at": self.created_at
+        })
+
+    def forget(self):
+        if self.message_id:
+            pending_store.delete(self.message_id)
+            view_registry.unregister(self)
+
+    @classmethod
+    def from_record(cls, record):
+        view = cls(record["lobby_id"], record["match_no"], record["stats_data"], record["admin_id"],
+                   existing_match_id=record["existing_match_id"], image_urls=record["image_urls"])
+        view.message_id = record["message_id"]
+        view.channel_id = record["channel_id"]
+        view.guild_id = record["guild_id"]
+        view.created_at = record["created_at"]
+        return view
+
+    async def load_images(self, session):
+        # Screenshots aren't persisted; after a restart they're fetched again from Discord's CDN
+        if not self.images and self.image_urls:
+            self.images = await download_urls(session, self.image_urls)
+        return self.images
+
+
+    @discord.ui.button(label="Confirm & Save", style=discord.ButtonStyle.green, custom_id="match_confirm:confirm")
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.admin_id:
             return await interaction.response.send_message("Only the admin who submitted can confirm.", ephemeral=True)
@@ -107,23 +131,12 @@ class MatchConfirmationView(discord.ui.View):
             child.disabled = True
         await interaction.message.edit(view=self)
 
-        # Use DB Manager
-        match_id = None
-        if self.existing_match_id:
-             # We are editing an existing match. 
-             # Simplest approach: Delete old results and insert new ones using the SAME match_id.
-             db.delete_match_results(self.existing_match_id)
-             match_id = self.existing_match_id
-             # match entry itself remains, we just replaced the detailed results
-        else:
-             match_id = db.create_match(interaction.guild.id, self.lobby_id, self.match_no)
-
         # Process each player's result
         print(f"[DEBUG] Confirming match with {len(self.stats_data)} players")
 
 
         # Fetch Lobby Teams for Team Name Matching
-        lobby_teams_raw = db.get_teams_in_lobby(self.lobby_id) # -> [(slot, id, team_name), ...]
+        lobby_teams_raw = await db.get_teams_in_lobby(self.lobby_id) # -> [(slot, id, team_name), ...]
         lobby_team_map = {} # name_lower -> id
         lobby_team_candidates = [] # (id, name) for fuzzy
         
@@ -132,32 +145,13 @@ class MatchConfirmationView(discord.ui.View):
             lobby_team_candidates.append((t_id, t_name))
 
 
-        # Helper functions
-        def normalize_spaced(text):
-            if not text: return ""
-            text = re.sub(r'[^a-zA-Z0-9]', ' ', text)
-            return ' '.join(text.split()).lower()
-
-        def normalize_strict(text):
-            if not text: return ""
-            return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
-
-        def get_best_fuzzy_match(target, candidates, cutoff=0.8):
-            target_strict = normalize_strict(target)
-            best_match = None
-            best_score = 0
-            if len(target_strict) < 3: return None
-
-            for cand_id, cand_ign in candidates:
-                cand_strict = normalize_strict(cand_ign)
-                if not cand_strict: continue
-                score = difflib.SequenceMatcher(None, target_strict, cand_strict).ratio()
-                if len(cand_strict) > 3 and (target_strict in cand_strict or cand_strict in target_strict):
-                    score = max(score, 0.9)
-                if score > best_score and score >= cutoff:
-                    best_score = score
-                    best_match = (cand_id, cand_ign)
-            return best_match[0] if best_match else None
+        # Roster index for this lobby (fetched once, reused across matches of the lobby)
+        roster = await get_roster_index(self.lobby_id)
+
+        team_matcher = FuzzyMatcher(lobby_team_candidates)
+
+        # Pick up players registered since the last sync (no-op if recently synced)
+        await player_registry.sync()
 
         # PASS 1: Identify players
         processed_players = []
@@ -172,10 +166,6 @@ class MatchConfirmationView(discord.ui.View):
             discord_id = None
             team_id = None
 
-            # Match against Lobby Roster
-            # Match against Lobby Roster
-            lobby_players = db.get_lobby_roster(self.lobby_id) 
-            
             # --- STRATEGY 1: Match by TEAM NAME (Strongest) ---
             if extracted_team_name:
                 # 1. Exact Name
@@ -184,65 +174,28 @@ class MatchConfirmationView(discord.ui.View):
                 
                 # 2. Fuzzy Name
                 if not team_id:
-                     team_id = get_best_fuzzy_match(extracted_team_name, lobby_team_candidates, cutoff=0.7)
+                     team_id = team_matcher.best_match(extracted_team_name, cutoff=0.7)
 
             # --- STRATEGY 2: Match by IGN (Fallback) ---
+            # 1-3. Exact / Spaced Norm / Strict Norm
             if not team_id:
-                # 1. Exact
-                for tid, tign in lobby_players:
-                    if tign.lower() == ign.lower():
-                        team_id = tid
-                        break
-                # 2. Spaced Norm
-
-            if not team_id:
-                norm_ign = normalize_spaced(ign)
-                for tid, tign in lobby_players:
-                    if normalize_spaced(tign) == norm_ign:
-                        team_id = tid
-                        break
-            # 3. Strict Norm
-            if not team_id:
-                strict_ign = normalize_strict(ign)
-                for tid, tign in lobby_players:
-                    if normalize_strict(tign) == strict_ign:
-                        team_id = tid
-                        break
+                team_id = roster.lookup(ign)
             # 4. Fuzzy
             if not team_id:
-                team_id = get_best_fuzzy_match(ign, lobby_players)
+                team_id = roster.fuzzy.best_match(ign)
 
-            # Match against Discord Users (Fallback)
+            # Match against Discord Users (Fallback, local registry mirror)
             if not team_id:
-                discord_id = db.get_player_by_ign(ign)
-                if discord_id:
-                    pass # Got it
-                else:
-                    all_players = db.get_all_players()
-                    norm_ign = normalize_spaced(ign)
-                    for pid, pign in all_players:
-                        if normalize_spaced(pign) == norm_ign:
-                            discord_id = pid
-                            break
-                    if not discord_id:
-                        strict_ign = normalize_strict(ign)
-                        for pid, pign in all_players:
-                            if normalize_strict(pign) == strict_ign:
-                                discord_id = pid
-                                break
-                    if not discord_id:
-                        discord_id = get_best_fuzzy_match(ign, all_players)
-
+                discord_id = player_registry.lookup(ign)
                 if discord_id:
-                    team_row = db.get_team_by_player(self.lobby_id, discord_id)
+                    team_row = await db.get_team_by_player(self.lobby_id, discord_id)
                     if team_row: team_id = team_row[0]
             
             if team_id and not discord_id:
-                d_id = db.get_discord_id_by_ign(team_id, ign)
+                d_id = player_registry.get_by_ign(ign)
                 if d_id: discord_id = d_id
 
             processed_players.append({
-                'match_id': match_id,
                 'ign': ign,
                 'discord_id': discord_id,
                 'team_id': team_id,
@@ -262,27 +215,26 @@ class MatchConfirmationView(discord.ui.View):
                     if not p['team_id']: p['team_id'] = common_team_id
 
         # PASS 3: Insert
-        for p in processed_players:
-            ign = p['ign']
-            team_id = p['team_id']
-            discord_id = p.get('discord_id')
-            kills = p['kills']
-            position = p['position']
-
-            if team_id:
-                db.insert_match_result(match_id, team_id, ign, discord_id, kills, position)
-            # else:
-            #     # Global stats tracking disabled per user request
-            #     pass
-        
-        
-        # No commit/close needed
+        # Players without a team are skipped (global stats tracking disabled per user request)
+        results = [p for p in processed_players if p['team_id']]
 
+        # Match row + all results are written in one request (and one transaction).
+        # When editing, the old results are replaced under the SAME match_id.
+        try:
+            match_id = await db.save_match(interaction.guild.id, self.lobby_id, self.match_no, results, existing_match_id=self.existing_match_id)
+        except Exception as e:
+            print(f"DB Error save_match: {e}")
+            # Nothing was saved, so the admin can retry (or edit/reject) from the same message
+            for child in self.children:
+                child.disabled = False
+            await interaction.message.edit(view=self)
+            return await interaction.followup.send(f"❌ Failed to save match, nothing was written: {e}")
 
         await interaction.followup.send(embed=discord.Embed(title=f"✅ Match Confirmed (ID: {match_id})", description="Results saved successfully!", color=discord.Color.green()))
 
+        self.forget()
         self.stop()
-        config = get_config(interaction.guild.id)
+        config = await get_config(interaction.guild.id)
         if config and config["staff_channel_id"]:
             staff_channel = interaction.guild.get_channel(config["staff_channel_id"])
             if staff_channel:
@@ -293,26 +245,59 @@ class MatchConfirmationView(discord.ui.View):
                 ))
 
 
-    @discord.ui.button(label="Edit Results", style=discord.ButtonStyle.gray)
+    @discord.ui.button(label="Edit Results", style=discord.ButtonStyle.gray, custom_id="match_confirm:edit")
     async def edit_results(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.admin_id:
             return await interaction.response.send_message("Only the admin who submitted can edit.", ephemeral=True)
         await interaction.response.send_message("Select the team (position) you want to edit:", view=TeamSelectView(self, interaction.message), ephemeral=True)
 
-    @discord.ui.button(label="Reject", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="Re-scan Position", style=discord.ButtonStyle.blurple, custom_id="match_confirm:rescan")
+    async def rescan(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.admin_id:
+            return await interaction.response.send_message("Only the admin who submitted can re-scan.", ephemeral=True)
+        if not self.images and not self.image_urls:
+            return await interaction.response.send_message("Screenshots are not available for this match. Use Edit Results instead.", ephemeral=True)
+        await interaction.response.send_modal(RescanModal(self, interaction.message))
+
+    @discord.ui.button(label="Reject", style=discord.ButtonStyle.red, custom_id="match_confirm:reject")
     async def reject(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.admin_id:
             return await interaction.response.send_message("Only the admin who submitted can reject.", ephemeral=True)
         await interaction.response.send_message("Match submission rejected.", ephemeral=True)
+        self.forget()
         self.stop()
         
     def update_stats(self, position, new_players):
         print(f"[DEBUG] Updating stats for Pos {position}. Old len: {len(self.stats_data)}")
+        # Hand-edited rows keep the screenshot of the rows they replace (so a later re-scan
+        # crops the right one); their old boxes no longer describe them
+        img_idx, _ = self.locate_position(position)
+        for p in new_players:
+            p.setdefault('img_idx', img_idx)
+            p.pop('box', None)
         self.stats_data = [p for p in self.stats_data if int(p.get('position', 0)) != position]
         self.stats_data.extend(new_players)
         print(f"[DEBUG] New len: {len(self.stats_data)}")
+        self.persist()
 
         
+    def locate_position(self, position):
+        """-> (img_idx, band) for a position, from the squad boxes found during extraction."""
+        rows = [p for p in self.stats_data if int(p.get('position', 0)) == position]
+        if rows:
+            img_idx = rows[0].get('img_idx', 0)
+        else:
+            # Missing squad: assume it's on the same screenshot as the nearest squad ranked above it
+            above = [p for p in self.stats_data if int(p.get('position', 0)) < position]
+            img_idx = max(above, key=lambda p: int(p.get('position', 0))).get('img_idx', 0) if above else 0
+
+        bands = {}
+        for p in self.stats_data:
+            box = p.get('box')
+            if box and p.get('img_idx', 0) == img_idx:
+                bands[int(p.get('position', 0))] = (box[0] / 1000, box[2] / 1000)
+        return img_idx, estimate_band(position, bands)
+
     def generate_embed(self):
         embed = discord.Embed(title=f"📊 Match #{self.match_no} Analysis (Edited)", description=f"Found {len(self.stats_data)} unique players.", color=discord.Color.gold())
         embed.set_footer(text="Data has been manually edited. Please verify before confirming.")
@@ -410,14 +395,83 @@ class EditTeamModal(discord.ui.Modal):
         except Exception as e:
             await interaction.response.send_message(f"❌ Failed to update message: {e}", ephemeral=True)
 
+class RescanModal(discord.ui.Modal, title="Re-scan Position"):
+    position_input = discord.ui.TextInput(label="Position to re-scan", placeholder="e.g. 4", max_length=2)
+
+    def __init__(self, parent_view, original_message):
+        super().__init__()
+        self.parent_view = parent_view
+        self.original_message = original_message
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            position = int(self.position_input.value.strip())
+        except ValueError:
+            return await interaction.response.send_message("❌ Position must be a number.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        img_idx, band = self.parent_view.locate_position(position)
+        try:
+            images = await self.parent_view.load_images(interaction.client.http_session)
+            extraction = await rescan_position(images, position, img_idx=img_idx, band=band)
+        except Exception as e:
+            print(f"Re-scan failed for position {position}: {e}")
+            err_msg = "❌ All API Keys have exceeded their quota! Please try again later." if isinstance(e, KeyPoolExhausted) else f"❌ Re-scan failed: {e}"
+            return await interaction.followup.send(err_msg, ephemeral=True)
+
+        new_players = ResultValidator.validate_and_correct(extraction.rows, [])
+        if not new_players:
+            return await interaction.followup.send(f"⚠️ No players found for position {position}. Use Edit Results to fill it in.", ephemeral=True)
+
+        self.parent_view.update_stats(position, new_players)
+        try:
+            await self.original_message.edit(embed=self.parent_view.generate_embed(), view=self.parent_view)
+            await interaction.followup.send(f"✅ Position {position} re-scanned: {len(new_players)} player(s).", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Failed to update message: {e}", ephemeral=True)
+
 class Matches(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        # Runs from setup_hook: re-attach the buttons of confirmations sent before the restart
+        view_registry.bind(self.bot)
+        records = pending_store.load_all()
+        for record in records:
+            view = MatchConfirmationView.from_record(record)
+            self.bot.add_view(view, message_id=record["message_id"])
+            view_registry.register(view)
+        if records:
+            print(f"♻️ Restored {len(records)} pending match confirmation(s)")
+        self.sweep_views.start()
+        self.reload_players.start()
+
+    async def cog_unload(self):
+        self.sweep_views.cancel()
+        self.reload_players.cancel()
+
+    @tasks.loop(minutes=10)
+    async def sweep_views(self):
+        await view_registry.sweep()
+
+    @sweep_views.before_loop
+    async def before_sweep_views(self):
+        await self.bot.wait_until_ready()
+
+    # Full players reload off the command path; confirm only pulls new rows (player_registry.sync)
+    @tasks.loop(seconds=PLAYERS_FULL_SYNC_INTERVAL)
+    async def reload_players(self):
+        await player_registry.reload()
+
+    @reload_players.before_loop
+    async def before_reload_players(self):
+        await self.bot.wait_until_ready()
+
     @app_commands.command(name="submit_match", description="Submit match result (up to 3 images) for AI processing")
     @app_commands.describe(lobby_id="Lobby ID", match_no="Match Number", image1="Screenshot 1", image2="Screenshot 2 (Optional)", image3="Screenshot 3 (Optional)")
     async def submit_match(self, interaction: discord.Interaction, lobby_id: int, match_no: int, image1: discord.Attachment, image2: discord.Attachment = None, image3: discord.Attachment = None):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("You don't have permission.", ephemeral=True)
 
         images = [img for img in [image1, image2, image3] if img is not None]
@@ -430,91 +484,35 @@ class Matches(commands.Cog):
 
         await interaction.response.defer(thinking=True)
 
-        # Prompt
-        # Advanced "Referee" Prompt
-        prompt = """
-        You are an official Esports Referee. Your job is to DIGITIZE this Free Fire results screenshot with 100% precision.
-        
-        INSTRUCTIONS:
-        1. Read the scoreboard ROW by ROW.
-        2. Verify columns: Rank (#), Player Name (IGN), Eliminations/Kills.
-        3. Ignore "Assists", "Damage", or "Total Points" columns if present. Focus ONLY on Kills.
-        4. CRITICAL: Distinguish between "Total Kills" (Team Kills) and "Individual Kills". 
-           - Usually, the Team Header shows Total Kills.
-           - The rows below it show Individual Kills.
-           - ONLY extract the INDIVIDUAL Kills.
-        
-        OUTPUT FORMAT:
-        Return a strict JSON list of objects.
-        [
-          {"ign": "Player1", "kills": 5, "position": 1, "team_name": "TeamA"},
-          {"ign": "Player2", "kills": 2, "position": 1, "team_name": "TeamA"},
-          {"ign": "EnemyX", "kills": 0, "position": 2, "team_name": "TeamB"}
-        ]
-        
-        RULES:
-        - "position": The Rank of the TEAM (1, 2, 3...). All players in the same squad get the SAME position.
-        - "ign": Exact spelling, case-sensitive. Capture special characters if possible.
-        - "kills": Must be a number.
-        - If a team has 4 players, output 4 entries with the same "position".
-        - Do not hallucinate players not in the image.
-        """
+        # Download + OCR run from the shared submission queue (fair between servers, paced to API key capacity)
+        async def show_position(position):
+            await interaction.edit_original_response(content=f"⏳ Queued for processing. Position in queue: **#{position}**")
+
+        async def show_failure(message):
+            await interaction.edit_original_response(content=message, embed=None, view=None)
+
+        try:
+            position = submission_queue.submit(interaction.guild.id, lambda: self.process_submission(interaction, lobby_id, match_no, images), on_queued=show_position, on_failed=show_failure)
+        except QueueFull as e:
+            return await interaction.followup.send(f"⏳ {e}")
+        print(f"[QUEUE] Match submission from guild {interaction.guild.id} queued at position {position}")
 
+    async def process_submission(self, interaction, lobby_id, match_no, images):
         combined_stats = []
         
         try:
             # Batch Image Processing
-            content_parts = [prompt]
-            async with aiohttp.ClientSession() as session:
-                for idx, img in enumerate(images):
-                    async with session.get(img.url) as resp:
-                        if resp.status == 200:
-                            img_data = await resp.read()
-                            content_parts.append({
-                                "mime_type": img.content_type, 
-                                "data": img_data
-                            })
-            
-            # Key Rotation Logic
-            from config import GEMINI_API_KEYS
-            import random
-
-            # Ensure we have a list
-            keys = GEMINI_API_KEYS if isinstance(GEMINI_API_KEYS, list) and GEMINI_API_KEYS else [GEMINI_API_KEY]
+            # Concurrent downloads on the bot's shared session
+            await interaction.edit_original_response(content=f"📥 Downloading {len(images)} screenshot(s)...")
+            downloaded = await download_attachments(self.bot.http_session, images) # [(bytes, mime_type)]
+            await interaction.edit_original_response(content="🤖 Reading results...")
             
-            response = None
-            last_error = None
-            
-            # Try each key until one works
-            for key_index, api_key in enumerate(keys):
-                try:
-                    # Configure with current key
-                    genai.configure(api_key=api_key)
-                    current_model = genai.GenerativeModel(target_model_name)
-                    
-                    print(f"[AI] Attempting with Key #{key_index+1}...")
-                    # Offload blocking call to thread
-                    # response = current_model.generate_content(content_parts)
-                    response = await asyncio.to_thread(current_model.generate_content, content_parts)
-                    last_error = None # Success
-                    break # Exit loop if successful
-
-                    
-                except Exception as e:
-                    last_error = e
-                    if "429" in str(e) or "Quota" in str(e):
-                        print(f"⚠️ Key #{key_index+1} Quota Exceeded. Switching...")
-                        continue # Try next key
-                    else:
-                        raise e # Not a quota error, probably something else
-            
-            if last_error:
-                raise last_error
-
-            raw_text = response.text.replace("```json", "").replace("```", "").strip()
-            if "[" in raw_text and "]" in raw_text:
-                raw_text = raw_text[raw_text.find("["):raw_text.rfind("]")+1]
-            data = json.loads(raw_text)
+            # Cache / preprocessing / key pool / parsing all handled by the extraction service
+            # 'fanout' servers send one call per screenshot in parallel (see /set_ocr_mode)
+            config = await get_config(interaction.guild.id)
+            fan_out = bool(config) and config["ocr_mode"] == "fanout"
+            extraction = await extract_match_results(downloaded, fan_out=fan_out)
+            data = extraction.rows
             
             # --- POST PROCESSING VALIDATOR ---
             # Fetch registered teams strictly for context if needed (future upgrade)
@@ -523,14 +521,16 @@ class Matches(commands.Cog):
             cleaned_data = ResultValidator.validate_and_correct(data, [])
             
             for i, p in enumerate(cleaned_data):
-                p['img_idx'] = 0 # Dummy index since we batch
+                p.setdefault('img_idx', 0) # Screenshot the squad was read from (kept for re-scans)
                 combined_stats.append(p)
 
         except Exception as e:
             print(f"Error processing images: {e}")
             err_msg = "⚠️ Error processing images. Please check the logs."
-            if "429" in str(e) or "Quota" in str(e):
+            if isinstance(e, KeyPoolExhausted):
                 err_msg = "⚠️ All API Keys have exceeded their quota! Please try again later."
+            elif isinstance(e, (AttachmentDownloadError, ExtractionError)):
+                err_msg = f"⚠️ {e}"
             
             try:
                 # Cleaner public error
@@ -571,7 +571,7 @@ class Matches(commands.Cog):
         combined_stats = final_stats
         
         if not combined_stats:
-            return await interaction.followup.send("❌ Failed to extract data.")
+            return await interaction.edit_original_response(content="❌ Failed to extract data.")
 
         try:
             embed = discord.Embed(title=f"📊 Match #{match_no} Analysis", description=f"Processed {len(images)} image(s). Found {len(combined_stats)} unique players.", color=discord.Color.gold())
@@ -591,7 +591,9 @@ class Matches(commands.Cog):
             if len(sorted_positions) > 25:
                 embed.set_footer(text="⚠️ Some teams hidden due to Discord limits. Please verify via Edit.")
 
-            await interaction.followup.send(embed=embed, view=MatchConfirmationView(lobby_id, match_no, combined_stats, interaction.user.id))
+            view = MatchConfirmationView(lobby_id, match_no, combined_stats, interaction.user.id, images=downloaded, image_urls=[img.url for img in images])
+            message = await interaction.edit_original_response(content=None, embed=embed, view=view)
+            view.attach(message)
 
         except Exception as e:
             await interaction.followup.send(f"⚠️ Error assembling results. Check hidden logs.", ephemeral=True)
@@ -600,10 +602,10 @@ class Matches(commands.Cog):
     @app_commands.command(name="edit_match", description="Edit a previously confirmed match")
     @app_commands.describe(match_id="The Match ID to edit")
     async def edit_match(self, interaction: discord.Interaction, match_id: int):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("No permission.", ephemeral=True)
             
-        match = db.get_match(match_id)
+        match = await db.get_match(match_id)
         if not match:
              return await interaction.response.send_message("Match not found.", ephemeral=True)
              
@@ -614,7 +616,7 @@ class Matches(commands.Cog):
         await interaction.response.defer()
         
         # Get Results
-        results = db.get_match_results(match_id)
+        results = await db.get_match_results(match_id)
         
         # Convert to stats_data format
         stats_data = []
@@ -646,15 +648,16 @@ class Matches(commands.Cog):
         embed = view.generate_embed()
         embed.title = f"📝 Editing Match #{match_no}"
         
-        await interaction.followup.send(embed=embed, view=view)
+        message = await interaction.followup.send(embed=embed, view=view, wait=True)
+        view.attach(message)
 
     @app_commands.command(name="matches", description="List all confirmed matches in a lobby")
     @app_commands.describe(lobby_id="Lobby ID to view matches for")
     async def list_matches(self, interaction: discord.Interaction, lobby_id: int):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("No permission.", ephemeral=True)
 
-        matches = db.get_matches_in_lobby(lobby_id)
+        matches = await db.get_matches_in_lobby(lobby_id)
         if not matches:
              return await interaction.response.send_message(f"No matches found for Lobby {lobby_id}.", ephemeral=True)
         
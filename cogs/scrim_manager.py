@@ -2,32 +2,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from database import db
-from utils import is_scrim_admin
-import google.generativeai as genai
-from config import GEMINI_API_KEY
-import aiohttp
-import json
+from utils import is_scrim_admin, download_attachments
+from matching import invalidate_roster_index
+from ai_extraction import extract_lobby_slots, ExtractionError
 import re
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-# Model selection (Flash is faster/cheaper, Pro is better for OCR)
-# Strictly prefer 1.5-flash for free tier limits
-# Strict Preference: 2.5 Flash
-# This has a limit of 20/day, but with 5 keys = 100/day.
-# All other models (2.0 Flash, Lite, Exp) returned Limit 0 for this user.
-target_model_name = 'models/gemini-2.5-flash'
-
-try:
-    available_models = [m.name for m in genai.list_models()]
-    if target_model_name not in available_models:
-        # Fallback to anything with 'flash' if 2.5 is somehow missing
-        if any('flash' in m for m in available_models):
-             target_model_name = next(m for m in available_models if 'flash' in m)
-except:
-    pass
-model = genai.GenerativeModel(target_model_name)
-
 class SlotListModal(discord.ui.Modal, title="Paste Slot List"):
     lobby_name = discord.ui.TextInput(label="Lobby Name", placeholder="e.g. 8 PM Scrim", max_length=50)
     slot_text = discord.ui.TextInput(label="Slot List", placeholder="1. Team A\n2. Team B...", style=discord.TextStyle.paragraph, max_length=4000)
@@ -65,11 +44,11 @@ class SlotListModal(discord.ui.Modal, title="Paste Slot List"):
 
         try:
             # 1. Create Lobby
-            lobby_id = db.create_lobby(guild_id, name, max(t[0] for t in teams_to_insert))
+            lobby_id = await db.create_lobby(guild_id, name, max(t[0] for t in teams_to_insert))
 
             # 2. Insert Teams
             for slot, t_name in teams_to_insert:
-                db.create_team(lobby_id, t_name, slot)
+                await db.create_team(lobby_id, t_name, slot)
             
             summary = "\n".join([f"**S{s}:** {n}" for s, n in teams_to_insert[:10]])
             if len(teams_to_insert) > 10: summary += f"\n...and {len(teams_to_insert)-10} more."
@@ -87,7 +66,7 @@ class ScrimManager(commands.Cog):
 
     @app_commands.command(name="start_scrim", description="Create a new lobby and paste slot list")
     async def start_scrim(self, interaction: discord.Interaction):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("No permission.", ephemeral=True)
         await interaction.response.send_modal(SlotListModal())
 
@@ -99,7 +78,7 @@ class ScrimManager(commands.Cog):
         image3="Lobby Screenshot 3 (Optional)"
     )
     async def upload_lobby_ss(self, interaction: discord.Interaction, lobby_id: int, image1: discord.Attachment, image2: discord.Attachment = None, image3: discord.Attachment = None):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("No permission.", ephemeral=True)
             
         images = [img for img in [image1, image2, image3] if img is not None]
@@ -113,7 +92,7 @@ class ScrimManager(commands.Cog):
         await interaction.response.defer(thinking=True)
 
         # 1. Get Lobby Teams Dictionary (Slot -> ID)
-        rows = db.get_teams_in_lobby(lobby_id)
+        rows = await db.get_teams_in_lobby(lobby_id)
         
         if not rows:
             return await interaction.followup.send("❌ Lobby not found or no teams registered.")
@@ -121,81 +100,38 @@ class ScrimManager(commands.Cog):
         slot_map = {row[0]: {"id": row[1], "name": row[2]} for row in rows}
         
         # 2. Process Images
-        async with aiohttp.ClientSession() as session:
-            mapped_count = 0
-            details = []
+        mapped_count = 0
+        details = []
+        
+        try:
+            # Batch Image Processing
+            # Concurrent downloads on the bot's shared session
+            downloaded = await download_attachments(self.bot.http_session, images) # [(bytes, mime_type)]
             
-            prompt = """
-            Analyze these Free Fire custom room lobby screenshots (combined).
-            Extract the SLOT NUMBER and the PLAYER IGN (In-Game Name) for every player visible across ALL images.
-
-            Rules:
-            - The slot number is usually on the left or part of the box (1, 2, 3.. 12).
-            - Ignore "Spectators" or non-player slots.
-            - Return strictly a single JSON list: [{"slot": 1, "ign": "Name"}, {"slot": 1, "ign": "Name2"}]
-            - If a slot has multiple players, list them all with the same slot number.
-            - Be precise with IGNs.
-            """
-
-            try:
-                # Batch Image Processing
-                content_parts = [prompt]
-                for idx, image in enumerate(images):
-                    async with session.get(image.url) as resp:
-                        if resp.status == 200:
-                            img_data = await resp.read()
-                            content_parts.append({
-                                "mime_type": image.content_type, 
-                                "data": img_data
-                            })
-                
-                # Single API Call with Rotation
-                from config import GEMINI_API_KEYS
-                
-                keys = GEMINI_API_KEYS if isinstance(GEMINI_API_KEYS, list) and GEMINI_API_KEYS else [GEMINI_API_KEY]
-                response = None
-                last_error = None
-                
-                for key_index, api_key in enumerate(keys):
-                    try:
-                        genai.configure(api_key=api_key)
-                        current_model = genai.GenerativeModel(target_model_name)
-                        response = current_model.generate_content(content_parts)
-                        last_error = None
-                        break
-                    except Exception as e:
-                        last_error = e
-                        if "429" in str(e) or "Quota" in str(e):
-                            continue
-                        else:
-                            raise e
-                
-                if last_error: raise last_error
-                
-                raw_text = response.text.replace("```json", "").replace("```", "").strip()
-                if "[" in raw_text and "]" in raw_text:
-                    raw_text = raw_text[raw_text.find("["):raw_text.rfind("]")+1]
-                else:
-                    return await interaction.followup.send("❌ AI failed to find structured data.")
-                
-                extracted = json.loads(raw_text)
+            extracted = (await extract_lobby_slots(downloaded)).rows
+            
+            for entry in extracted:
+                slot = entry.get("slot")
+                ign = entry.get("ign")
                 
-                for entry in extracted:
-                    slot = entry.get("slot")
-                    ign = entry.get("ign")
+                if slot in slot_map and ign:
+                    team_id = slot_map[slot]["id"]
+                    team_name = slot_map[slot]["name"]
                     
-                    if slot in slot_map and ign:
-                        team_id = slot_map[slot]["id"]
-                        team_name = slot_map[slot]["name"]
-                        
-                        # Insert mapping using DB
-                        if db.add_team_player(team_id, ign) > 0:
-                            mapped_count += 1
-                            details.append(f"Slot {slot} ({team_name}) <- {ign}")
-
-            except Exception as e:
-                print(f"Error processing images: {e}")
-                return await interaction.followup.send(f"⚠️ Error: {e}")
+                    # Insert mapping using DB
+                    if await db.add_team_player(team_id, ign) > 0:
+                        mapped_count += 1
+                        details.append(f"Slot {slot} ({team_name}) <- {ign}")
+
+        except ExtractionError as e:
+            return await interaction.followup.send(f"❌ {e}")
+        except Exception as e:
+            print(f"Error processing images: {e}")
+            return await interaction.followup.send(f"⚠️ Error: {e}")
+        finally:
+            # Roster may have changed; next match confirmation rebuilds the index
+            if mapped_count:
+                invalidate_roster_index(lobby_id)
 
         # No commit needed
 
@@ -217,10 +153,10 @@ class ScrimManager(commands.Cog):
     @app_commands.command(name="status", description="Check current status of a scrim lobby")
     @app_commands.describe(lobby_id="Lobby ID")
     async def status(self, interaction: discord.Interaction, lobby_id: int):
-        if not is_scrim_admin(interaction.user):
+        if not await is_scrim_admin(interaction.user):
             return await interaction.response.send_message("No permission.", ephemeral=True)
             
-        lobby = db.get_lobby(lobby_id)
+        lobby = await db.get_lobby(lobby_id)
         if not lobby:
             return await interaction.response.send_message("❌ Lobby not found.", ephemeral=True)
             
@@ -228,7 +164,7 @@ class ScrimManager(commands.Cog):
         # (id, guild_id, name, state, max_teams, reg_start, match_start, channel_id)
         _, _, name, state, _, _, _, _ = lobby
         
-        matches = db.get_matches_in_lobby(lobby_id)
+        matches = await db.get_matches_in_lobby(lobby_id)
         match_count = len(matches)
         last_match_no = max([m['match_no'] for m in matches]) if matches else 0
         
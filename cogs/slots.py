@@ -12,7 +12,7 @@ class Slots(commands.Cog):
     @app_commands.describe(lobby_id="The ID of the lobby")
     async def slots(self, interaction: discord.Interaction, lobby_id: int):
         # Get lobby info
-        lobby = db.get_lobby(lobby_id)
+        lobby = await db.get_lobby(lobby_id)
         if not lobby:
             return await interaction.response.send_message("Lobby not found.", ephemeral=True)
 
@@ -20,7 +20,7 @@ class Slots(commands.Cog):
         max_teams = lobby[4]
         
         # Get registered teams with slots
-        teams_rows = db.get_teams_in_lobby(lobby_id)
+        teams_rows = await db.get_teams_in_lobby(lobby_id)
         # teams_rows is list of (slot, id, team_name)
         teams = {row[0]: row[2] for row in teams_rows}
 
@@ -14,6 +14,25 @@ GEMINI_API_KEYS = [k.strip() for k in keys_str.split(",") if k.strip()]
 if not GEMINI_API_KEYS:
      GEMINI_API_KEYS = [GEMINI_API_KEY]
 
+# Per-key Gemini limits (free tier 2.5 Flash: 10 RPM, 20/day). 0 = no limit.
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "10"))
+GEMINI_KEY_RPD = int(os.getenv("GEMINI_KEY_RPD", "20"))
+# Longest a request will wait for a rate-limited key before giving up (seconds)
+GEMINI_MAX_KEY_WAIT = int(os.getenv("GEMINI_MAX_KEY_WAIT", "20"))
+
+# Screenshot downloads (per attachment)
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+ATTACHMENT_TIMEOUT = int(os.getenv("ATTACHMENT_TIMEOUT", "15"))
+
+# /submit_match job queue
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "50")) # queued submissions across all servers
+JOB_QUEUE_PER_GUILD = int(os.getenv("JOB_QUEUE_PER_GUILD", "5"))
+JOB_WORKERS_PER_KEY = int(os.getenv("JOB_WORKERS_PER_KEY", "1")) # concurrent jobs per usable API key
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "600")) # per job, also capped by the interaction token's remaining life
+INTERACTION_TOKEN_TTL = 15 * 60 # Discord interaction tokens expire 15 min after the command
+JOB_TOKEN_MARGIN = int(os.getenv("JOB_TOKEN_MARGIN", "30")) # token time kept back to post the failure message
+JOB_MIN_RUN_TIME = int(os.getenv("JOB_MIN_RUN_TIME", "90")) # queued jobs with less token time than this are dropped
+
 PLACEMENT_POINTS = {
     1: 12,
     2: 9,
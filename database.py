@@ -1,75 +1,139 @@
 import os
-from supabase import create_client, Client
+import asyncio
+import time
+from supabase import acreate_client, AsyncClient
 from dotenv import load_dotenv
+from config import PLACEMENT_POINTS, KILL_POINTS
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Max Supabase requests in flight at once (shared by all guilds).
+# The async client keeps a pooled keep-alive HTTP connection, so this only caps bursts.
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "10"))
+
+# Seconds a cached server_config row stays valid. Writes through this manager invalidate it immediately.
+CONFIG_CACHE_TTL = int(os.getenv("CONFIG_CACHE_TTL", "300"))
+
+def placement_points_array():
+    # PLACEMENT_POINTS as a Postgres array: index n (1-based) = points for position n
+    return [PLACEMENT_POINTS.get(pos, 0) for pos in range(1, max(PLACEMENT_POINTS) + 1)]
+
 class DatabaseManager:
     def __init__(self):
+        self.supabase: AsyncClient = None
+        self._semaphore = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+        self._config_cache = {} # guild_id -> (expires_at, config tuple or None)
+
+    async def connect(self):
+        """Creates the async Supabase client. Called once from PTMaker.setup_hook."""
+        if self.supabase: return
         if not SUPABASE_URL or not SUPABASE_KEY:
             print("❌ Supabase Credentials missing. DB operations will fail.")
-            self.supabase = None
-        else:
-            self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-            print("✅ Connected to Supabase")
+            return
+        self.supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        print("✅ Connected to Supabase")
 
+    async def close(self):
+        if self.supabase:
+            await self.supabase.postgrest.aclose()
+            self.supabase = None
 
+    async def _execute(self, query):
+        # Every request goes through here so a burst from one guild can't starve the others
+        async with self._semaphore:
+            return await query.execute()
 
     # --- API Methods ---
-    
-    def get_config(self, guild_id):
+
+    @staticmethod
+    def _config_tuple(d):
+        return (
+            d.get('guild_id'),
+            d.get('scrim_admin_role_id'),
+            d.get('timezone'),
+            d.get('staff_channel_id'),
+            d.get('results_channel_id'),
+            d.get('reg_channel_id'),
+            d.get('host_name'),
+            d.get('host_logo'),
+            d.get('ocr_mode') or 'batch'
+        )
+
+    def _cache_config(self, guild_id, config):
+        # None is cached too, so unconfigured guilds don't hit the DB on every command
+        self._config_cache[str(guild_id)] = (time.monotonic() + CONFIG_CACHE_TTL, config)
+
+    def invalidate_config(self, guild_id):
+        self._config_cache.pop(str(guild_id), None)
+
+    async def warm_config_cache(self, guild_ids):
+        """Loads the config of every given guild in bulk (called on startup)."""
+        if not self.supabase: return
+        guild_ids = [str(g) for g in guild_ids]
+        try:
+            # Chunked to keep the PostgREST URL short
+            for start in range(0, len(guild_ids), 100):
+                chunk = guild_ids[start:start + 100]
+                response = await self._execute(self.supabase.table("server_config").select("*").in_("guild_id", chunk))
+                found = {d['guild_id']: self._config_tuple(d) for d in response.data}
+                for g in chunk:
+                    self._cache_config(g, found.get(g))
+        except Exception as e:
+            print(f"DB Error warm_config_cache: {e}")
+
+    async def get_config(self, guild_id):
         if not self.supabase: return None
+        cached = self._config_cache.get(str(guild_id))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
         try:
-            response = self.supabase.table("server_config").select("*").eq("guild_id", str(guild_id)).execute()
-            if response.data:
-                d = response.data[0]
-                return (
-                    d.get('guild_id'),
-                    d.get('scrim_admin_role_id'),
-                    d.get('timezone'),
-                    d.get('staff_channel_id'),
-                    d.get('results_channel_id'),
-                    d.get('reg_channel_id'),
-                    d.get('host_name'),
-                    d.get('host_logo')
-                )
-            return None
+            response = await self._execute(self.supabase.table("server_config").select("*").eq("guild_id", str(guild_id)))
+            config = self._config_tuple(response.data[0]) if response.data else None
+            self._cache_config(guild_id, config)
+            return config
         except Exception as e:
             print(f"DB Error get_config: {e}")
             return None
 
-    def upsert_config(self, guild_id, role_id, staff_id, results_id):
+    async def upsert_config(self, guild_id, role_id, staff_id, results_id):
         data = {
             "guild_id": str(guild_id),
             "scrim_admin_role_id": str(role_id),
             "staff_channel_id": str(staff_id),
             "results_channel_id": str(results_id)
         }
-        self.supabase.table("server_config").upsert(data).execute()
+        await self._execute(self.supabase.table("server_config").upsert(data))
+        self.invalidate_config(guild_id)
 
-    def update_branding(self, guild_id, host_name, host_logo=None):
+    async def update_branding(self, guild_id, host_name, host_logo=None):
         data = {"guild_id": str(guild_id), "host_name": host_name}
         if host_logo:
              data["host_logo"] = host_logo
-        self.supabase.table("server_config").upsert(data).execute()
+        await self._execute(self.supabase.table("server_config").upsert(data))
+        self.invalidate_config(guild_id)
+
+    async def update_ocr_mode(self, guild_id, mode):
+        data = {"guild_id": str(guild_id), "ocr_mode": mode}
+        await self._execute(self.supabase.table("server_config").upsert(data))
+        self.invalidate_config(guild_id)
 
     # --- Lobbies ---
 
-    def create_lobby(self, guild_id, name, max_teams):
+    async def create_lobby(self, guild_id, name, max_teams):
         data = {
             "guild_id": str(guild_id),
             "name": name,
             "max_teams": max_teams,
             "state": "ACTIVE"
         }
-        res = self.supabase.table("lobbies").insert(data).execute()
+        res = await self._execute(self.supabase.table("lobbies").insert(data))
         return res.data[0]['id']
 
-    def get_lobby(self, lobby_id):
-        res = self.supabase.table("lobbies").select("*").eq("id", lobby_id).execute()
+    async def get_lobby(self, lobby_id):
+        res = await self._execute(self.supabase.table("lobbies").select("*").eq("id", lobby_id))
         if res.data:
             d = res.data[0]
             # Map to tuple: id, guild_id, name, state, max_teams, reg_start, match_start, channel_id
@@ -79,122 +143,109 @@ class DatabaseManager:
             )
         return None
     
-    def close_lobby(self, lobby_id):
-        self.supabase.table("lobbies").update({"state": "COMPLETED"}).eq("id", lobby_id).execute()
+    async def close_lobby(self, lobby_id):
+        await self._execute(self.supabase.table("lobbies").update({"state": "COMPLETED"}).eq("id", lobby_id))
 
     # --- Teams ---
 
-    def create_team(self, lobby_id, team_name, slot_no):
+    async def create_team(self, lobby_id, team_name, slot_no):
         data = {"lobby_id": lobby_id, "team_name": team_name, "slot_no": slot_no}
-        self.supabase.table("teams").insert(data).execute()
+        await self._execute(self.supabase.table("teams").insert(data))
 
-    def get_teams_in_lobby(self, lobby_id):
+    async def get_teams_in_lobby(self, lobby_id):
         # Return list of (slot_no, id, team_name)
-        res = self.supabase.table("teams").select("slot_no, id, team_name").eq("lobby_id", lobby_id).order("slot_no").execute()
+        res = await self._execute(self.supabase.table("teams").select("slot_no, id, team_name").eq("lobby_id", lobby_id).order("slot_no"))
         return [(r['slot_no'], r['id'], r['team_name']) for r in res.data]
 
-    def add_team_player(self, team_id, ign):
+    async def add_team_player(self, team_id, ign):
         data = {"team_id": team_id, "ign": ign}
-        res = self.supabase.table("team_players").upsert(data, on_conflict="team_id, ign").execute()
+        res = await self._execute(self.supabase.table("team_players").upsert(data, on_conflict="team_id, ign"))
         return len(res.data)
 
-    def get_team_by_player(self, lobby_id, discord_id):
+    async def get_team_by_player(self, lobby_id, discord_id):
         # 1. Get IGN from Players
-        res_p = self.supabase.table("players").select("ign").eq("discord_id", str(discord_id)).execute()
+        res_p = await self._execute(self.supabase.table("players").select("ign").eq("discord_id", str(discord_id)))
         if not res_p.data: return None
         ign = res_p.data[0]['ign']
         
         # 2. Get Team from TeamPlayers
-        res_t = self.supabase.table("team_players").select("team_id, teams!inner(id, team_name, lobby_id)")\
-            .eq("ign", ign).eq("teams.lobby_id", lobby_id).execute()
+        res_t = await self._execute(self.supabase.table("team_players").select("team_id, teams!inner(id, team_name, lobby_id)")\
+            .eq("ign", ign).eq("teams.lobby_id", lobby_id))
         
         if res_t.data:
             t = res_t.data[0]['teams']
             return (t['id'], t['team_name'])
         return None
 
-    def get_discord_id_by_ign(self, team_id, ign):
-        res = self.supabase.table("players").select("discord_id").eq("ign", ign).execute()
-        if res.data:
-            return res.data[0]['discord_id']
-        return None
-
     # --- Matches Support Methods ---
     
-    def get_lobby_roster(self, lobby_id):
+    async def get_lobby_roster(self, lobby_id):
         # Join teams -> team_players
         # Returns [(team_id, ign), ...]
-        res = self.supabase.table("team_players").select("team_id, ign, teams!inner(lobby_id)").eq("teams.lobby_id", lobby_id).execute()
+        res = await self._execute(self.supabase.table("team_players").select("team_id, ign, teams!inner(lobby_id)").eq("teams.lobby_id", lobby_id))
         return [(r['team_id'], r['ign']) for r in res.data]
 
-    def get_player_by_ign(self, ign):
-        # Returns discord_id
-        res = self.supabase.table("players").select("discord_id").ilike("ign", ign).execute() # Case insensitive? ilike
-        if res.data:
-            return res.data[0]['discord_id']
-        return None
-
-    def get_all_players(self):
-        # Returns [(discord_id, ign)]
-        res = self.supabase.table("players").select("discord_id, ign").execute()
-        return [(r['discord_id'], r['ign']) for r in res.data]
+    async def get_players_page(self, after_id=0, limit=1000):
+        # Returns [(id, discord_id, ign)] with id > after_id, in id order.
+        # Paged explicitly so PostgREST's max-rows cap can't silently truncate the registry.
+        res = await self._execute(self.supabase.table("players").select("id, discord_id, ign").gt("id", after_id).order("id").limit(limit))
+        return [(r['id'], r['discord_id'], r['ign']) for r in res.data]
 
     # --- Matches ---
 
-    def create_match(self, guild_id, lobby_id, match_no):
-        data = {
-            "guild_id": str(guild_id),
-            "lobby_id": lobby_id,
-            "match_no": match_no,
-            "confirmed": 1
+    async def save_match(self, guild_id, lobby_id, match_no, results, existing_match_id=None):
+        # Creates the match (or clears an existing one), inserts all results and
+        # updates lobby_standings atomically.
+        # results: [{'team_id', 'ign', 'discord_id', 'kills', 'position'}, ...]
+        # Returns match_id
+        rows = [{
+            "team_id": r['team_id'],
+            "player_ign": r['ign'],
+            "player_discord_id": r.get('discord_id'),
+            "kills": r['kills'],
+            "position": r['position']
+        } for r in results]
+        params = {
+            "p_guild_id": str(guild_id),
+            "p_lobby_id": lobby_id,
+            "p_match_no": match_no,
+            "p_results": rows,
+            "p_placement_points": placement_points_array(),
+            "p_match_id": existing_match_id
         }
-        res = self.supabase.table("matches").insert(data).execute()
-        return res.data[0]['id']
-
-    def insert_match_result(self, match_id, team_id, ign, discord_id, kills, position):
-        data = {
-            "match_id": match_id,
-            "team_id": team_id,
-            "player_ign": ign,
-            "player_discord_id": discord_id,
-            "kills": kills,
-            "position": position
-        }
-        self.supabase.table("match_results").insert(data).execute()
+        res = await self._execute(self.supabase.rpc("save_match_results", params))
+        return res.data
 
-    def get_match(self, match_id):
-        res = self.supabase.table("matches").select("*").eq("id", match_id).execute()
+    async def get_match(self, match_id):
+        res = await self._execute(self.supabase.table("matches").select("*").eq("id", match_id))
         return res.data[0] if res.data else None
 
-    def get_match_results(self, match_id):
+    async def get_match_results(self, match_id):
         # Join with teams to get team_name if needed, but for ConfirmationView we mostly need ign, kills, position, team_id
-        res = self.supabase.table("match_results").select("team_id, player_ign, kills, position, teams(team_name)").eq("match_id", match_id).execute()
+        res = await self._execute(self.supabase.table("match_results").select("team_id, player_ign, kills, position, teams(team_name)").eq("match_id", match_id))
         return res.data
 
-    def delete_match_results(self, match_id):
-        self.supabase.table("match_results").delete().eq("match_id", match_id).execute()
-
-    def get_matches_in_lobby(self, lobby_id):
-        res = self.supabase.table("matches").select("id, match_no, created_at").eq("lobby_id", lobby_id).order("match_no").execute()
+    async def get_matches_in_lobby(self, lobby_id):
+        res = await self._execute(self.supabase.table("matches").select("id, match_no, created_at").eq("lobby_id", lobby_id).order("match_no"))
         return res.data
 
 
 
     # --- Player Stats ---
 
-    def get_player_ign(self, discord_id):
-        res = self.supabase.table("players").select("ign").eq("discord_id", str(discord_id)).execute()
+    async def get_player_ign(self, discord_id):
+        res = await self._execute(self.supabase.table("players").select("ign").eq("discord_id", str(discord_id)))
         return res.data[0]['ign'] if res.data else None
     
-    def get_player_stats_summary(self, discord_id, guild_id):
-        res = self.supabase.table("player_stats").select("total_kills, booyahs, matches_played").eq("discord_id", str(discord_id)).eq("guild_id", str(guild_id)).execute()
+    async def get_player_stats_summary(self, discord_id, guild_id):
+        res = await self._execute(self.supabase.table("player_stats").select("total_kills, booyahs, matches_played").eq("discord_id", str(discord_id)).eq("guild_id", str(guild_id)))
         if res.data:
             d = res.data[0]
             return (d['total_kills'], d['booyahs'], d['matches_played'])
         return None
 
-    def update_player_stats(self, discord_id, guild_id, kills, is_booyah):
-        curr = self.get_player_stats_summary(discord_id, guild_id)
+    async def update_player_stats(self, discord_id, guild_id, kills, is_booyah):
+        curr = await self.get_player_stats_summary(discord_id, guild_id)
         if curr:
             k, b, m = curr
             data = {
@@ -202,7 +253,7 @@ class DatabaseManager:
                 "booyahs": b + (1 if is_booyah else 0),
                 "matches_played": m + 1
             }
-            self.supabase.table("player_stats").update(data).eq("discord_id", str(discord_id)).eq("guild_id", str(guild_id)).execute()
+            await self._execute(self.supabase.table("player_stats").update(data).eq("discord_id", str(discord_id)).eq("guild_id", str(guild_id)))
         else:
             data = {
                 "discord_id": str(discord_id),
@@ -211,30 +262,21 @@ class DatabaseManager:
                 "booyahs": 1 if is_booyah else 0,
                 "matches_played": 1
             }
-            self.supabase.table("player_stats").insert(data).execute()
+            await self._execute(self.supabase.table("player_stats").insert(data))
 
     # --- Stats Aggregation ---
 
-    def get_lobby_team_stats(self, lobby_id):
-        teams = self.get_teams_in_lobby(lobby_id)
-        results = []
-        for slot, t_id, t_name in teams:
-            res = self.supabase.table("match_results").select("kills, match_id").eq("team_id", t_id).execute()
-            mr = res.data
-            total_kills = sum(r['kills'] for r in mr)
-            matches_played = len(set(r['match_id'] for r in mr))
-            results.append((t_name, t_id, total_kills, matches_played))
-        return results
-
-    def get_team_match_positions(self, team_id):
-        res = self.supabase.table("match_results").select("match_id, position").eq("team_id", team_id).execute()
-        pos_map = {}
-        for r in res.data:
-            mid = r['match_id']
-            p = r['position']
-            if mid not in pos_map or p < pos_map[mid]:
-                pos_map[mid] = p
-        return list(pos_map.items())
+    async def get_lobby_standings(self, lobby_id):
+        # Reads the lobby_standings table maintained by save_match_results (one row per team)
+        # Returns [{'team_id', 'team_name', 'slot_no', 'matches', 'booyahs', 'placement_points', 'kills', 'total'}, ...]
+        # Placement points let the RPC backfill lobbies saved before lobby_standings existed
+        params = {
+            "p_lobby_id": lobby_id,
+            "p_kill_points": KILL_POINTS,
+            "p_placement_points": placement_points_array()
+        }
+        res = await self._execute(self.supabase.rpc("get_lobby_standings", params))
+        return res.data
 
 # Singleton Instance
 db = DatabaseManager()
@@ -0,0 +1,131 @@
+import re
+import time
+import asyncio
+import datetime
+from google import genai
+from google.genai import errors
+from config import GEMINI_API_KEYS, GEMINI_KEY_RPM, GEMINI_KEY_RPD, GEMINI_MAX_KEY_WAIT
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TZ = ZoneInfo("America/Los_Angeles") # Gemini daily quotas reset at midnight Pacific
+except Exception:
+    QUOTA_TZ = datetime.timezone(datetime.timedelta(hours=-8))
+
+# Cooldown for a per-minute 429 when the error doesn't say how long to wait
+DEFAULT_COOLDOWN = 60
+
+class KeyPoolExhausted(Exception):
+    """No API key can take a request (all over daily quota, or busy longer than GEMINI_MAX_KEY_WAIT)."""
+
+def _quota_day():
+    return datetime.datetime.now(QUOTA_TZ).date()
+
+class _KeySlot:
+    def __init__(self, index, api_key):
+        self.label = f"Key #{index + 1}"
+        self.client = genai.Client(api_key=api_key)
+        self.tokens = float(GEMINI_KEY_RPM)
+        self.refilled_at = time.monotonic()
+        self.day = _quota_day()
+        self.used_today = 0
+        self.cooldown_until = 0
+        self.in_flight = 0
+
+    def _refresh(self, now):
+        # RPM token bucket refill + daily counter reset
+        if GEMINI_KEY_RPM:
+            self.tokens = min(GEMINI_KEY_RPM, self.tokens + (now - self.refilled_at) * GEMINI_KEY_RPM / 60)
+        self.refilled_at = now
+        day = _quota_day()
+        if day != self.day:
+            self.day = day
+            self.used_today = 0
+
+    def exhausted_today(self):
+        return bool(GEMINI_KEY_RPD) and self.used_today >= GEMINI_KEY_RPD
+
+    def wait_time(self, now):
+        """Seconds until this key can take a request, or None if it's done for the day."""
+        self._refresh(now)
+        if self.exhausted_today(): return None
+        wait = max(0, self.cooldown_until - now)
+        if GEMINI_KEY_RPM and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) * 60 / GEMINI_KEY_RPM)
+        return wait
+
+    def take(self):
+        if GEMINI_KEY_RPM: self.tokens -= 1
+        self.used_today += 1
+        self.in_flight += 1
+
+class GeminiKeyPool:
+    """
+    Schedules Gemini requests across GEMINI_API_KEYS. Each key has its own client,
+    an RPM token bucket and a daily request count. Keys that return 429 are cooled
+    down (or parked until the daily reset), and each request goes to the least
+    loaded key that is available.
+    """
+    def __init__(self, api_keys):
+        self.slots = [_KeySlot(i, k) for i, k in enumerate(api_keys) if k]
+
+    @property
+    def default_client(self):
+        return self.slots[0].client if self.slots else None
+
+    def capacity(self):
+        """Keys that still have daily quota (cooling-down keys count; they come back within minutes)."""
+        now = time.monotonic()
+        return sum(1 for s in self.slots if s.wait_time(now) is not None)
+
+    async def _acquire(self):
+        if not self.slots:
+            raise KeyPoolExhausted("No Gemini API keys configured.")
+        while True:
+            now = time.monotonic()
+            waits = [(s, s.wait_time(now)) for s in self.slots]
+            ready = [s for s, w in waits if w == 0]
+            if ready:
+                slot = min(ready, key=lambda s: (s.in_flight, s.used_today, -s.tokens))
+                slot.take()
+                return slot
+            pending = [w for _, w in waits if w is not None]
+            if not pending:
+                raise KeyPoolExhausted("All API keys have exceeded their daily Quota (429).")
+            if min(pending) > GEMINI_MAX_KEY_WAIT:
+                raise KeyPoolExhausted(f"All API keys are rate limited (Quota 429), next one frees up in {int(min(pending))}s.")
+            await asyncio.sleep(min(pending))
+
+    def _rate_limited(self, slot, error):
+        text = str(error)
+        if "PerDay" in text or "per day" in text.lower():
+            # Daily quota is gone; don't touch this key again until the reset
+            slot.used_today = max(slot.used_today, GEMINI_KEY_RPD or 1)
+            if not GEMINI_KEY_RPD:
+                slot.cooldown_until = time.monotonic() + 3600
+            print(f"⚠️ {slot.label} daily quota exhausted. Parked until reset.")
+            return
+        slot.used_today -= 1 # per-minute rejections don't count against the daily quota
+        match = re.search(r"retry[^0-9]{0,20}(\d+(?:\.\d+)?)\s*s", text, re.IGNORECASE)
+        delay = float(match.group(1)) if match else DEFAULT_COOLDOWN
+        slot.cooldown_until = time.monotonic() + delay
+        slot.tokens = min(slot.tokens, 0)
+        print(f"⚠️ {slot.label} rate limited. Cooling down for {int(delay)}s.")
+
+    async def generate_content(self, model, contents, config=None):
+        """Runs one generate_content call on the best available key, moving on after 429s."""
+        while True:
+            slot = await self._acquire()
+            try:
+                print(f"[AI] Attempting with {slot.label}...")
+                return await slot.client.aio.models.generate_content(model=model, contents=contents, config=config)
+            except errors.APIError as e:
+                if e.code == 429:
+                    self._rate_limited(slot, e)
+                    continue
+                raise
+            finally:
+                slot.in_flight -= 1
+
+# Singleton Instance
+key_pool = GeminiKeyPool(GEMINI_API_KEYS)
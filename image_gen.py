@@ -1,90 +1,209 @@
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from collections import OrderedDict
+from functools import lru_cache
 import os
+import io
 import random
 import glob
+from logo_cache import logo_cache
+
+# Portrait Resolution (High Quality)
+W, H = 1080, 1350
+
+BG_DIR = os.path.join(os.path.dirname(__file__), "assets", "backgrounds")
+# Output encoding: png (RENDER_PNG_LEVEL 0-9, lower = faster, bigger), webp or jpeg (RENDER_QUALITY)
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "png").lower()
+RENDER_PNG_LEVEL = int(os.getenv("RENDER_PNG_LEVEL", "6"))
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", "90"))
+_EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg", "jpg": "jpg"}
+POINTS_TABLE_FILENAME = f"points_table.{_EXTENSIONS.get(RENDER_FORMAT, 'png')}"
+
+# Ready-to-draw backgrounds kept in memory (~4-6 MB each at 1080x1350).
+# 0 = room for every file in assets/backgrounds, so each is only ever loaded once.
+BG_CACHE_SIZE = int(os.getenv("BG_CACHE_SIZE", "0"))
+
+_bg_files = None
+_bg_dir_mtime = None
+_bg_cache = OrderedDict() # path -> resized background with the dark overlay applied
+
+def _background_files():
+    # Re-globbed only when the folder changes
+    global _bg_files, _bg_dir_mtime
+    try:
+        mtime = os.path.getmtime(BG_DIR)
+    except OSError:
+        return []
+    if _bg_files is None or mtime != _bg_dir_mtime:
+        _bg_files = glob.glob(os.path.join(BG_DIR, "*.png")) + glob.glob(os.path.join(BG_DIR, "*.jpg"))
+        _bg_dir_mtime = mtime
+    return _bg_files
+
+def _apply_overlay(bg):
+    # Dark overlay for readability. The old per-line bottom gradient was fully
+    # overwritten by the solid tint drawn after it, so the tint is all that shows.
+    overlay = Image.new('RGBA', (W, H), (0, 0, 0, 80))
+    bg.paste(overlay, (0, 0), overlay)
+    return bg
+
+def _load_background(path):
+    if path is None:
+        # Fallback dark background
+        return _apply_overlay(Image.new('RGB', (W, H), (15, 15, 25)))
+    try:
+        bg = Image.open(path).resize((W, H), Image.Resampling.LANCZOS)
+    except:
+        bg = Image.new('RGB', (W, H), (20, 20, 30))
+    return _apply_overlay(bg)
+
+def get_background(path):
+    """Resized + overlaid background for a file (None = plain dark), as a fresh copy to draw on."""
+    bg = _bg_cache.get(path)
+    if bg is None:
+        bg = _load_background(path)
+        _bg_cache[path] = bg
+        limit = BG_CACHE_SIZE or len(_background_files()) + 1 # +1: plain fallback background
+        while len(_bg_cache) > limit:
+            _bg_cache.popitem(last=False)
+    else:
+        _bg_cache.move_to_end(path)
+    return bg.copy()
+
+# --- FONTS ---
+FONT_FACES = {
+    "bold": ["segoeuib.ttf", "arialbd.ttf"],
+    "regular": ["segoeui.ttf", "arial.ttf"]
+}
+TEXT_LAYOUT_CACHE_SIZE = int(os.getenv("TEXT_LAYOUT_CACHE_SIZE", "2048"))
+
+# Team name box is x 135-550; text starts at 160, keep the same margin on the right
+NAME_MAX_WIDTH = 550 - 160 - 15
+NAME_FONT_SIZE = 23
+NAME_MIN_FONT_SIZE = 14
+
+_font_files = {} # face -> resolved font file (None = Pillow default)
+_fonts = {} # (face, size) -> font
+
+def get_font(face, size):
+    """Font for a face in FONT_FACES, resolved and loaded once per size."""
+    key = (face, size)
+    font = _fonts.get(key)
+    if font is not None: return font
+    if face not in _font_files:
+        _font_files[face] = None
+        for name in FONT_FACES[face]:
+            try:
+                ImageFont.truetype(name, size)
+                _font_files[face] = name
+                break
+            except:
+                continue
+    path = _font_files[face]
+    font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+    _fonts[key] = font
+    return font
+
+@lru_cache(maxsize=TEXT_LAYOUT_CACHE_SIZE)
+def text_bbox(text, face, size):
+    return get_font(face, size).getbbox(text)
+
+@lru_cache(maxsize=TEXT_LAYOUT_CACHE_SIZE)
+def text_width(text, face, size):
+    return get_font(face, size).getlength(text)
+
+@lru_cache(maxsize=TEXT_LAYOUT_CACHE_SIZE)
+def fit_text(text, face, size, max_width, min_size):
+    """
+    -> (text, size) that fits max_width: shrinks the font down to min_size, then
+    truncates with an ellipsis. Starts from a proportional estimate, so long names
+    take two or three measurements instead of one per size.
+    """
+    width = text_width(text, face, size)
+    if width <= max_width: return text, size
+    fit = max(min_size, min(size - 1, int(size * max_width / width)))
+    while fit > min_size and text_width(text, face, fit) > max_width:
+        fit -= 1
+    if text_width(text, face, fit) <= max_width: return text, fit
+    # Still too wide at the smallest size: longest prefix that fits with "…"
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if text_width(text[:mid].rstrip() + "…", face, min_size) <= max_width: lo = mid
+        else: hi = mid - 1
+    return text[:lo].rstrip() + "…", min_size
+
+DEFAULT_LOGO_PATH = os.path.join(os.path.dirname(__file__), "assets", "logo.png")
+_local_logos = {} # path -> thumbnailed logo (or None)
+
+def _local_logo(path):
+    if path not in _local_logos:
+        logo_img = None
+        try:
+            if os.path.exists(path):
+                logo_img = Image.open(path)
+                logo_img.thumbnail((120, 120), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print(f"Error loading logo: {e}")
+            logo_img = None
+        _local_logos[path] = logo_img
+    return _local_logos[path]
+
+_ff_logo = None # (image or None,) once loaded
+
+def _footer_logo():
+    global _ff_logo
+    if _ff_logo is None:
+        ff_logo = None
+        ff_logo_path = os.path.join(os.path.dirname(__file__), "assets", "ffmax_logo.png")
+        if os.path.exists(ff_logo_path):
+            try:
+                ff_logo = Image.open(ff_logo_path)
+                ff_logo.thumbnail((400, 100), Image.Resampling.LANCZOS)
+            except:
+                ff_logo = None
+        _ff_logo = (ff_logo,)
+    return _ff_logo[0]
+
+def encode_image(img):
+    """Encodes the finished table in memory (RENDER_FORMAT) and returns the bytes."""
+    buf = io.BytesIO()
+    if RENDER_FORMAT == "webp":
+        img.save(buf, format="WEBP", quality=RENDER_QUALITY, method=4)
+    elif RENDER_FORMAT in ("jpeg", "jpg"):
+        img.convert("RGB").save(buf, format="JPEG", quality=RENDER_QUALITY, optimize=True)
+    else:
+        img.save(buf, format="PNG", compress_level=RENDER_PNG_LEVEL)
+    return buf.getvalue()
 
 def generate_points_table(lobby_name, host_name, teams_data, logo_path=None):
     """
     Points Table with Random Background Rotation & Clean Rounded UI.
+    Returns the encoded image bytes (file name: POINTS_TABLE_FILENAME).
     """
-    # Portrait Resolution (High Quality)
-    W, H = 1080, 1350
-    
     # --- 1. BACKGROUND SELECTION ---
-    # Look for backgrounds in assets/backgrounds/
-    bg_dir = os.path.join(os.path.dirname(__file__), "assets", "backgrounds")
-    bg_files = glob.glob(os.path.join(bg_dir, "*.png")) + glob.glob(os.path.join(bg_dir, "*.jpg"))
-    
-    if bg_files:
-        selected_bg = random.choice(bg_files)
-        try:
-            bg = Image.open(selected_bg).resize((W, H), Image.Resampling.LANCZOS)
-        except:
-            bg = Image.new('RGB', (W, H), (20, 20, 30))
-    else:
-        # Fallback dark background
-        bg = Image.new('RGB', (W, H), (15, 15, 25))
-        
+    # Random background from assets/backgrounds/, resized and darkened once, then cached
+    bg_files = _background_files()
+    bg = get_background(random.choice(bg_files) if bg_files else None)
     draw = ImageDraw.Draw(bg)
-    
-    # Dark Vignette/Overlay for readability
-    overlay = Image.new('RGBA', (W, H), (0,0,0,0))
-    o_draw = ImageDraw.Draw(overlay)
-    # Gradient from bottom up
-    for y in range(H):
-        alpha = int(200 * (y/H)) # Darker at bottom
-        o_draw.line([(0, y), (W, y)], fill=(0, 0, 0, 50 + int(alpha*0.8)))
-    # Solid dark tint overall
-    o_draw.rectangle([0,0,W,H], fill=(0,0,0,80))
-    bg.paste(overlay, (0,0), overlay)
-
-    # --- FONTS ---
-    def get_font(name_list, size):
-        for name in name_list:
-            try:
-                return ImageFont.truetype(name, size)
-            except:
-                continue
-        return ImageFont.load_default()
 
-    font_title = get_font(["segoeuib.ttf", "arialbd.ttf"], 48)
-    font_bold = get_font(["segoeuib.ttf", "arialbd.ttf"], 23)  # Smaller Team Names
-    font_data = get_font(["segoeuib.ttf", "arialbd.ttf"], 25)  # Smaller Stats
-    font_header = get_font(["segoeui.ttf", "arial.ttf"], 18)
-    font_sub = get_font(["segoeui.ttf", "arial.ttf"], 32)
-    font_logo = get_font(["segoeuib.ttf", "arialbd.ttf"], 36)
+    # --- FONTS --- (loaded once, see get_font)
+    font_bold = get_font("bold", NAME_FONT_SIZE)  # Smaller Team Names
+    font_data = get_font("bold", 25)  # Smaller Stats
+    font_header = get_font("regular", 18)
+    font_sub = get_font("regular", 32)
+    font_logo = get_font("bold", 36)
 
     # --- HEADER SECTION ---
     # Layout: [Logo]  [Host Name] (Centered together)
-    # 1. Load Logo
-    # 1. Load Logo
-    import requests
-    import io
-    
-    if not logo_path:
+    # 1. Load Logo (URLs come from the logo cache, filled before rendering; no network here)
+    if logo_path and logo_path.startswith("http"):
+        logo_img = logo_cache.get(logo_path)
+    else:
         # Fallback to local default
-        logo_path = os.path.join(os.path.dirname(__file__), "assets", "logo.png")
-        
-    logo_img = None
-    
-    try:
-        # Check if URL
-        if logo_path.startswith("http"):
-            resp = requests.get(logo_path)
-            if resp.status_code == 200:
-                logo_img = Image.open(io.BytesIO(resp.content))
-        elif os.path.exists(logo_path):
-            logo_img = Image.open(logo_path)
-            
-        if logo_img:
-            logo_img.thumbnail((120, 120), Image.Resampling.LANCZOS)
-    except Exception as e:
-        print(f"Error loading logo: {e}")
-        pass
+        logo_img = _local_logo(logo_path or DEFAULT_LOGO_PATH)
 
     # 2. Prepare Text
-    font_host_big = get_font(["segoeuib.ttf", "arialbd.ttf"], 65) # Slightly smaller to fit side-by-side
-    mask_bbox = draw.textbbox((0, 0), host_name.upper(), font=font_host_big)
+    font_host_big = get_font("bold", 65) # Slightly smaller to fit side-by-side
+    mask_bbox = text_bbox(host_name.upper(), "bold", 65)
     text_w = mask_bbox[2] - mask_bbox[0]
     text_h = mask_bbox[3] - mask_bbox[1]
     
@@ -164,7 +283,9 @@ def generate_points_table(lobby_name, host_name, teams_data, logo_path=None):
         # 2. Team Name Box
         name_rect = [135, curr_y, 550, curr_y + ROW_HEIGHT]
         draw.rounded_rectangle(name_rect, radius=8, fill=row_bg_color, outline=outline_color, width=outline_width)
-        draw.text((160, curr_y + ROW_HEIGHT//2), team['team'].upper(), font=font_bold, fill=(20, 20, 20), anchor="lm")
+        # Long names are shrunk (then truncated) to stay inside the box
+        name_text, name_size = fit_text(team['team'].upper(), "bold", NAME_FONT_SIZE, NAME_MAX_WIDTH, NAME_MIN_FONT_SIZE)
+        draw.text((160, curr_y + ROW_HEIGHT//2), name_text, font=get_font("bold", name_size), fill=(20, 20, 20), anchor="lm")
         
         # 3. Stats Boxes
         stats_vals = [
@@ -190,23 +311,13 @@ def generate_points_table(lobby_name, host_name, teams_data, logo_path=None):
     # --- FOOTER (FF MAX LOGO) ---
     footer_y = H - 50 # Lowered to bottom edge
     
-    ff_logo_path = os.path.join(os.path.dirname(__file__), "assets", "ffmax_logo.png")
-    if os.path.exists(ff_logo_path):
-        try:
-            ff_logo = Image.open(ff_logo_path)
-            # Resize
-            ff_logo.thumbnail((400, 100), Image.Resampling.LANCZOS)
-            ff_x = (W - ff_logo.width) // 2
-            ff_y = H - ff_logo.height - 20
-            bg.paste(ff_logo, (ff_x, ff_y), ff_logo if ff_logo.mode == 'RGBA' else None)
-        except:
-            draw.text((W//2, footer_y), "FREE FIRE MAX", font=font_logo, fill=(255, 255, 255), anchor="mm")
+    ff_logo = _footer_logo() # loaded and resized once
+    if ff_logo:
+        ff_x = (W - ff_logo.width) // 2
+        ff_y = H - ff_logo.height - 20
+        bg.paste(ff_logo, (ff_x, ff_y), ff_logo if ff_logo.mode == 'RGBA' else None)
     else:
         # Text fallback if no logo
         draw.text((W//2, footer_y), "FREE FIRE MAX", font=font_logo, fill=(255, 255, 255), anchor="mm")
     
-    # Save with unique filename to prevent race conditions
-    import uuid
-    output_path = f"points_table_{uuid.uuid4().hex[:8]}.png"
-    bg.save(output_path)
-    return output_path
\ No newline at end of file
+    return encode_image(bg)
\ No newline at end of file
@@ -0,0 +1,106 @@
+import os
+import io
+import time
+import asyncio
+from PIL import Image, ImageChops
+
+# Screenshot preprocessing before upload to Gemini: crop, downscale and re-encode.
+# Phone screenshots are 2-5 MB PNGs; the model reads text fine at ~1500px.
+PREP_MAX_SIDE = int(os.getenv("PREP_MAX_SIDE", "1536"))
+PREP_JPEG_QUALITY = int(os.getenv("PREP_JPEG_QUALITY", "88"))
+# Stack all screenshots of one command into a single image (one vision input instead of up to 3).
+# Lobby screenshots only: results keep one image each so squad boxes stay per screenshot (Re-scan).
+PREP_TILE = os.getenv("PREP_TILE", "0") == "1"
+
+def _crop_box(kind):
+    # Optional fixed region per screenshot kind, as fractions "left,top,right,bottom"
+    # e.g. PREP_CROP_RESULTS="0,0.12,1,0.95" to drop the top bar and bottom buttons
+    raw = os.getenv(f"PREP_CROP_{kind.upper()}")
+    if not raw: return None
+    try:
+        box = tuple(float(v) for v in raw.split(","))
+        return box if len(box) == 4 else None
+    except ValueError:
+        return None
+
+def _trim_borders(img):
+    # Drops uniform margins (letterboxing / black bars) around the game screen
+    bg = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, bg).convert("L").point(lambda p: 255 if p > 16 else 0)
+    bbox = diff.getbbox()
+    return img.crop(bbox) if bbox else img
+
+def _prepare_geometry(img, kind):
+    """
+    Crop + border trim, without downscaling. Squad boxes (0-1000) are measured on this
+    frame, so Re-scan crops from the same frame whatever the settings.
+    """
+    img = img.convert("RGB")
+    box = _crop_box(kind)
+    if box:
+        w, h = img.size
+        img = img.crop((int(box[0] * w), int(box[1] * h), int(box[2] * w), int(box[3] * h)))
+    return _trim_borders(img)
+
+def _prepare_one(img, kind):
+    img = _prepare_geometry(img, kind)
+    if max(img.size) > PREP_MAX_SIDE:
+        img.thumbnail((PREP_MAX_SIDE, PREP_MAX_SIDE), Image.Resampling.LANCZOS)
+    return img
+
+def _tile(imgs):
+    # Vertical stack at a common width
+    width = min(i.width for i in imgs)
+    scaled = [i if i.width == width else i.resize((width, round(i.height * width / i.width)), Image.Resampling.LANCZOS) for i in imgs]
+    sheet = Image.new("RGB", (width, sum(i.height for i in scaled)), (0, 0, 0))
+    y = 0
+    for i in scaled:
+        sheet.paste(i, (0, y))
+        y += i.height
+    return sheet
+
+def _encode(img):
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=PREP_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+def preprocess_images(images, kind="results"):
+    """
+    images: [(bytes, mime_type), ...]
+    kind: "results" or "lobby" (selects the PREP_CROP_<KIND> region)
+
+    Returns [(bytes, mime_type), ...] ready to upload, in input order. Images Pillow
+    can't decode are passed through untouched (and turn tiling off).
+    """
+    # Kept in input order: the model's "image" index refers to these positions
+    items = []
+    for data, mime in images:
+        try:
+            items.append(_prepare_one(Image.open(io.BytesIO(data)), kind))
+        except Exception as e:
+            print(f"[PREP] Could not preprocess image ({mime}): {e}")
+            items.append((data, mime))
+
+    decoded_all = all(isinstance(item, Image.Image) for item in items)
+    if PREP_TILE and kind != "results" and decoded_all and len(items) > 1:
+        items = [_tile(items[:3])] + items[3:]
+
+    return [(_encode(item), "image/jpeg") if isinstance(item, Image.Image) else item for item in items]
+
+def crop_band(data, top, bottom, pad=0.03):
+    """Full-width horizontal strip between top and bottom (fractions of the height), as JPEG bytes."""
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    h = img.height
+    y0 = max(0, int((top - pad) * h))
+    y1 = min(h, int((bottom + pad) * h))
+    if y1 - y0 < 8: return data
+    return _encode(img.crop((0, y0, img.width, y1)))
+
+async def prepare_images(images, kind="results"):
+    """Runs preprocess_images in a worker thread and logs the savings."""
+    start = time.perf_counter()
+    prepared = await asyncio.to_thread(preprocess_images, images, kind)
+    before = sum(len(d) for d, _ in images)
+    after = sum(len(d) for d, _ in prepared)
+    print(f"[PREP] {len(images)} {kind} image(s): {before / 1024:.0f} KB -> {after / 1024:.0f} KB in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return prepared
@@ -0,0 +1,147 @@
+import asyncio
+from collections import OrderedDict, deque
+from config import JOB_QUEUE_MAX, JOB_QUEUE_PER_GUILD, JOB_WORKERS_PER_KEY, JOB_TIMEOUT, INTERACTION_TOKEN_TTL, JOB_TOKEN_MARGIN, JOB_MIN_RUN_TIME
+from gemini_pool import key_pool
+
+class QueueFull(Exception):
+    """The queue (or this server's share of it) is full."""
+
+class Job:
+    def __init__(self, guild_id, run, on_queued=None, on_failed=None):
+        self.guild_id = guild_id
+        self.run = run # async callable doing the actual work
+        self.on_queued = on_queued # async callable(position), told when the queue position changes
+        self.on_failed = on_failed # async callable(message), told when the job is dropped, times out or crashes
+        self.expires_at = asyncio.get_running_loop().time() + INTERACTION_TOKEN_TTL # the interaction token's expiry
+        self.position = None
+        self.started = False
+        self.lock = asyncio.Lock() # keeps "queued" edits from landing after the job's own progress edits
+
+    async def notify(self, position):
+        async with self.lock:
+            if self.started or not self.on_queued: return
+            try:
+                await self.on_queued(position)
+            except Exception as e:
+                print(f"[QUEUE] Position update failed: {e}")
+
+    async def fail(self, message):
+        if not self.on_failed: return
+        try:
+            await self.on_failed(message)
+        except Exception as e:
+            print(f"[QUEUE] Failure notice failed: {e}")
+
+class FairJobQueue:
+    """
+    Bounded job queue with round-robin between guilds: a server that submits five
+    matches at once can't push everyone else's submission to the back. The number
+    of jobs running at once follows the API keys that still have quota.
+    """
+    def __init__(self, max_pending, per_guild, workers_per_key, timeout):
+        self.max_pending = max_pending
+        self.per_guild = per_guild
+        self.workers_per_key = workers_per_key
+        self.timeout = timeout
+        self.queues = OrderedDict() # guild_id -> deque of Job, in round-robin order
+        self.pending = 0
+        self.running = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._tasks = set()
+
+    def concurrency(self):
+        return max(1, key_pool.capacity() * self.workers_per_key)
+
+    def start(self):
+        if not self._dispatcher:
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in list(self._tasks): task.cancel()
+
+    def submit(self, guild_id, run, on_queued=None, on_failed=None):
+        """Queues a job. Returns its position (0 = starts right away). Raises QueueFull."""
+        if self.pending >= self.max_pending:
+            raise QueueFull("The bot is processing a lot of submissions right now. Please try again in a few minutes.")
+        guild_queue = self.queues.setdefault(guild_id, deque())
+        if len(guild_queue) >= self.per_guild:
+            raise QueueFull(f"This server already has {len(guild_queue)} submissions waiting. Please wait for them to finish.")
+
+        job = Job(guild_id, run, on_queued, on_failed)
+        guild_queue.append(job)
+        self.pending += 1
+        # Jobs ahead of it in the rotation, minus the worker slots free right now
+        free_slots = max(0, self.concurrency() - self.running)
+        job.position = max(0, self._dispatch_order().index(job) + 1 - free_slots)
+        if job.position:
+            self._spawn(job.notify(job.position))
+        self._wakeup.set()
+        return job.position
+
+    def _dispatch_order(self):
+        # Round-robin: the first job of every guild, then every guild's second job, ...
+        order = []
+        queues = [list(q) for q in self.queues.values()]
+        for depth in range(max((len(q) for q in queues), default=0)):
+            order.extend(q[depth] for q in queues if len(q) > depth)
+        return order
+
+    def _next_job(self):
+        guild_id, guild_queue = next(iter(self.queues.items()))
+        job = guild_queue.popleft()
+        # Served guild goes to the back of the rotation (or leaves it if empty)
+        del self.queues[guild_id]
+        if guild_queue: self.queues[guild_id] = guild_queue
+        self.pending -= 1
+        return job
+
+    def _announce_positions(self):
+        for i, job in enumerate(self._dispatch_order(), 1):
+            if job.position != i:
+                job.position = i
+                self._spawn(job.notify(i))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending and self.running < self.concurrency():
+                job = self._next_job()
+                self.running += 1
+                self._spawn(self._run(job))
+            if self.pending:
+                self._announce_positions()
+
+    async def _run(self, job):
+        # Whatever happens, the response has to be edited before the token expires
+        run_time = min(self.timeout, job.expires_at - asyncio.get_running_loop().time() - JOB_TOKEN_MARGIN)
+        try:
+            async with job.lock:
+                job.started = True
+            if run_time < JOB_MIN_RUN_TIME:
+                print(f"[QUEUE] Dropped job for guild {job.guild_id}: only {run_time:.0f}s of token time left")
+                return await job.fail("⚠️ This submission waited in the queue for too long. Please submit the match again.")
+            await asyncio.wait_for(job.run(), timeout=run_time)
+        except asyncio.TimeoutError:
+            print(f"[QUEUE] Job for guild {job.guild_id} timed out after {run_time:.0f}s")
+            await job.fail("⚠️ Processing took too long and was stopped. Please submit the match again.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[QUEUE] Job for guild {job.guild_id} failed: {e}")
+            await job.fail("⚠️ Error processing images. Please check the logs.")
+        finally:
+            self.running -= 1
+            self._wakeup.set()
+
+# Singleton Instance
+submission_queue = FairJobQueue(JOB_QUEUE_MAX, JOB_QUEUE_PER_GUILD, JOB_WORKERS_PER_KEY, JOB_TIMEOUT)
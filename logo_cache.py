@@ -0,0 +1,85 @@
+import os
+import io
+import asyncio
+import hashlib
+import aiohttp
+from collections import OrderedDict
+from PIL import Image
+from config import ATTACHMENT_MAX_BYTES, ATTACHMENT_TIMEOUT
+
+# Host logos for the points table, downloaded once per URL (async, with a timeout) and
+# stored thumbnailed on disk + in memory. Rendering only reads from here, never the network.
+# Also keeps logos working after Discord's signed attachment URLs expire.
+LOGO_CACHE_DIR = os.getenv("LOGO_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache", "logos"))
+LOGO_MEMORY_SIZE = 64
+LOGO_SIZE = (120, 120)
+
+class LogoCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.memory = OrderedDict() # url -> thumbnailed Image
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".png")
+
+    def _remember(self, url, img):
+        self.memory[url] = img
+        self.memory.move_to_end(url)
+        while len(self.memory) > LOGO_MEMORY_SIZE:
+            self.memory.popitem(last=False)
+
+    def get(self, url):
+        """Cached logo for a URL (memory, then disk), or None. No network access."""
+        img = self.memory.get(url)
+        if img is not None:
+            self.memory.move_to_end(url)
+            return img
+        path = self._path(url)
+        if not os.path.exists(path): return None
+        try:
+            img = Image.open(path)
+            img.load()
+        except Exception as e:
+            print(f"Logo cache read failed ({path}): {e}")
+            return None
+        self._remember(url, img)
+        return img
+
+    def _store(self, url, data):
+        # Decode + thumbnail + save; runs in a worker thread
+        img = Image.open(io.BytesIO(data))
+        img = img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img
+        img.thumbnail(LOGO_SIZE, Image.Resampling.LANCZOS)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(url) + ".tmp"
+        img.save(tmp_path, format="PNG")
+        os.replace(tmp_path, self._path(url))
+        return img
+
+    async def fetch(self, session: aiohttp.ClientSession, url, force=False):
+        """Makes sure the logo for url is cached. Returns the image, or None if it couldn't be fetched."""
+        if not url or not url.startswith("http"): return None
+        if not force:
+            img = self.get(url)
+            if img is not None: return img
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=ATTACHMENT_TIMEOUT)) as resp:
+                if resp.status != 200:
+                    print(f"Logo download failed (HTTP {resp.status}): {url}")
+                    return None
+                # content.read(n) only returns what's buffered so far; read the whole body in chunks
+                data = bytearray()
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    data.extend(chunk)
+                    if len(data) > ATTACHMENT_MAX_BYTES:
+                        print(f"Logo too large, skipped: {url}")
+                        return None
+            img = await asyncio.to_thread(self._store, url, bytes(data))
+        except Exception as e:
+            print(f"Error loading logo: {e}")
+            return None
+        self._remember(url, img)
+        return img
+
+# Singleton Instance
+logo_cache = LogoCache(LOGO_CACHE_DIR)
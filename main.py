@@ -1,9 +1,13 @@
 import discord
 from discord.ext import commands
 import os
+import aiohttp
 
 from config import TOKEN
 from database import db #, init_db
+from job_queue import submission_queue
+from pending_store import pending_store
+from render_service import render_service
 
 # Intents
 intents = discord.Intents.default()
@@ -17,10 +21,18 @@ class PTMaker(commands.Bot):
             intents=intents,
             help_command=None
         )
+        self.http_session: aiohttp.ClientSession = None
 
     async def setup_hook(self):
         print("Initializing database...")
+        await db.connect()
 
+        # One pooled HTTP session for the bot's lifetime (attachment downloads, logos)
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=60)
+        )
+        submission_queue.start()
         
         # Ensure cogs directory exists
         if not os.path.exists("./cogs"):
@@ -37,9 +49,21 @@ class PTMaker(commands.Bot):
         
         print("Bot is ready to sync. Use !sync to sync global commands or !clear_guild to remove server-specific duplicates.")
 
+    async def close(self):
+        await submission_queue.stop()
+        if self.http_session:
+            await self.http_session.close()
+        await db.close()
+        pending_store.close()
+        render_service.close()
+        await super().close()
+
     async def on_ready(self):
         print(f"Logged in as {self.user} (ID: {self.user.id})")
         print(f"Bot is in {len(self.guilds)} servers.")
+
+        # Preload every guild's config so permission checks don't hit the DB
+        await db.warm_config_cache([g.id for g in self.guilds])
         
         # Verbose Logging of commands in tree
         print("\nRegistered Slash Commands in Tree:")
@@ -0,0 +1,155 @@
+import re
+from collections import OrderedDict, Counter, defaultdict
+from database import db
+
+# Max lobbies whose roster index is kept in memory (least recently used is dropped first)
+ROSTER_CACHE_SIZE = 256
+
+def normalize_spaced(text):
+    if not text: return ""
+    text = re.sub(r'[^a-zA-Z0-9]', ' ', text)
+    return ' '.join(text.split()).lower()
+
+def normalize_strict(text):
+    if not text: return ""
+    return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
+
+def _trigrams(text):
+    # Padded so the first/last characters form their own grams (helps short IGNs)
+    padded = f"$${text}$$"
+    counts = defaultdict(int)
+    for i in range(len(padded) - 2):
+        counts[padded[i:i + 3]] += 1
+    return counts
+
+def lcs_length(a, b):
+    """Length of the longest common subsequence (bit-parallel, O(len(b)) big-int ops)."""
+    if not a or not b: return 0
+    masks = {}
+    for i, ch in enumerate(a):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for ch in b:
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+def similarity(a, b):
+    """Indel similarity in [0, 1]: 2 * LCS / total length. Never lower than difflib's ratio()."""
+    if not a or not b: return 0.0
+    return 2 * lcs_length(a, b) / (len(a) + len(b))
+
+class FuzzyMatcher:
+    """
+    Fuzzy lookup over [(id, name), ...] using a trigram index: candidates are taken
+    in order of shared trigrams, and only those whose shared count can still reach
+    the cutoff (or the best score so far) are scored with similarity() on
+    strict-normalized names.
+    A candidate that contains the target (or vice versa) scores at least 0.9,
+    same as the old difflib scan.
+    """
+    def __init__(self, candidates):
+        self.entries = [] # (id, strict_name)
+        # (trigram, n) -> entry indexes of the names holding that trigram at least n times
+        self.postings = defaultdict(list)
+        for cand_id, cand_name in candidates:
+            self.add(cand_id, cand_name)
+
+    def add(self, cand_id, cand_name):
+        strict = normalize_strict(cand_name)
+        if not strict: return
+        idx = len(self.entries)
+        self.entries.append((cand_id, strict))
+        for gram, count in _trigrams(strict).items():
+            for n in range(1, count + 1):
+                self.postings[(gram, n)].append(idx)
+
+    def best_match(self, target, cutoff=0.8):
+        """Returns the id of the best candidate scoring >= cutoff, or None."""
+        target_strict = normalize_strict(target)
+        if len(target_strict) < 3: return None
+
+        # Candidates sharing at least one trigram with the target, with the number of
+        # trigrams shared (multiset intersection, counted by Counter in C)
+        shared = Counter()
+        for gram, count in _trigrams(target_strict).items():
+            for n in range(1, count + 1):
+                shared.update(self.postings.get((gram, n), ()))
+
+        best_id = None
+        best_idx = None
+        best_score = 0
+        t_len = len(target_strict)
+        # Most shared trigrams first, so best_score rises early and prunes the rest
+        for idx, common in shared.most_common():
+            # One shared trigram caps similarity() below 0.8 (bound below) whatever the
+            # length, and rules out containment for targets over 3 characters
+            if common <= 1 and t_len > 3 and max(cutoff, best_score) >= 0.8: break
+            cand_id, cand_strict = self.entries[idx]
+            c_len = len(cand_strict)
+            if c_len > 3 and (target_strict in cand_strict or cand_strict in target_strict):
+                score = max(similarity(target_strict, cand_strict), 0.9)
+            else:
+                # Upper bound on similarity() before scoring. Turning one name into the other
+                # takes (t - LCS) deletions, each breaking at most 3 padded trigrams, and
+                # (c - LCS) insertions, each breaking at most 2; so
+                # shared >= 5 * LCS - 2 * (t + c) + 2, and LCS can't exceed the shorter name
+                lcs_max = min(t_len, c_len, (common + 2 * (t_len + c_len) - 2) // 5)
+                if 2 * lcs_max / (t_len + c_len) < max(cutoff, best_score): continue
+                score = similarity(target_strict, cand_strict)
+            # Ties go to the earliest candidate, like the linear scan
+            if score >= cutoff and (score > best_score or (score == best_score and idx < best_idx)):
+                best_score = score
+                best_idx = idx
+                best_id = cand_id
+        return best_id
+
+class RosterIndex:
+    """
+    Lookup tables for a lobby roster, keyed by exact (lowercased), spaced-normalized
+    and strict-normalized IGN. Each key maps to the team_id of the first roster entry
+    that produced it, same as the old linear scans.
+    """
+    def __init__(self, roster):
+        # roster: [(team_id, ign), ...] as returned by db.get_lobby_roster
+        self.players = roster
+        self.exact = {}
+        self.spaced = {}
+        self.strict = {}
+        self.fuzzy = FuzzyMatcher(roster)
+        for team_id, ign in roster:
+            if not ign: continue
+            self.exact.setdefault(ign.lower(), team_id)
+            spaced = normalize_spaced(ign)
+            if spaced: self.spaced.setdefault(spaced, team_id)
+            strict = normalize_strict(ign)
+            if strict: self.strict.setdefault(strict, team_id)
+
+    def lookup(self, ign):
+        """Returns team_id for an exact / spaced / strict IGN match, or None."""
+        if not ign: return None
+        team_id = self.exact.get(ign.lower())
+        if not team_id:
+            team_id = self.spaced.get(normalize_spaced(ign))
+        if not team_id:
+            team_id = self.strict.get(normalize_strict(ign))
+        return team_id
+
+_roster_indexes = OrderedDict() # lobby_id -> RosterIndex
+
+async def get_roster_index(lobby_id):
+    """Returns the cached RosterIndex for a lobby, fetching the roster once if needed."""
+    index = _roster_indexes.get(lobby_id)
+    if index is None:
+        index = RosterIndex(await db.get_lobby_roster(lobby_id))
+        _roster_indexes[lobby_id] = index
+        if len(_roster_indexes) > ROSTER_CACHE_SIZE:
+            _roster_indexes.popitem(last=False)
+    else:
+        _roster_indexes.move_to_end(lobby_id)
+    return index
+
+def invalidate_roster_index(lobby_id):
+    """Call after the lobby's team_players change (e.g. /upload_lobby_ss)."""
+    _roster_indexes.pop(lobby_id, None)
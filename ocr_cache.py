@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+# Parsed Gemini extractions, keyed by screenshot bytes + prompt + model.
+# Lets a rejected /submit_match or /upload_lobby_ss be re-run without spending quota.
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache", "ocr"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+class OCRCache:
+    """
+    On-disk JSON cache with LRU eviction by total size. Each entry is one file;
+    its mtime is bumped on every hit so the least recently used go first.
+    File access runs in a worker thread; sizes are tracked in memory (one directory
+    scan on first use), so a write doesn't rescan the directory.
+    """
+    def __init__(self, directory, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory = directory
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @directory.setter
+    def directory(self, directory):
+        with self._lock:
+            self._directory = directory
+            self._entries = None # path -> (last use, size), loaded lazily
+            self._total = 0
+
+    @staticmethod
+    def make_key(images, prompt, model_name):
+        # images: list of raw bytes, in upload order
+        h = hashlib.sha256()
+        for part in (model_name.encode(), prompt.encode()):
+            h.update(len(part).to_bytes(8, "big"))
+            h.update(part)
+        for data in images:
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(hashlib.sha256(data).digest())
+        return h.hexdigest()
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._read, key)
+
+    async def put(self, key, data):
+        await asyncio.to_thread(self._write, key, data)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+            with self._lock:
+                if self._entries is not None and path in self._entries:
+                    self._entries[path] = (time.time(), self._entries[path][1])
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"OCR cache read failed ({key[:12]}): {e}")
+            return None
+
+    def _write(self, key, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._load_entries()
+                _, old_size = self._entries.get(path, (0, 0))
+                self._entries[path] = (time.time(), size)
+                self._total += size - old_size
+                self._evict()
+        except Exception as e:
+            print(f"OCR cache write failed ({key[:12]}): {e}")
+
+    def _load_entries(self):
+        # Once per directory: entries written by earlier runs
+        if self._entries is not None: return
+        self._entries = {}
+        self._total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"): continue
+                st = entry.stat()
+                self._entries[entry.path] = (st.st_mtime, st.st_size)
+                self._total += st.st_size
+
+    def _evict(self):
+        if self._total <= self.max_bytes: return
+        for path, (_, size) in sorted(self._entries.items(), key=lambda e: e[1][0]):
+            if self._total <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            del self._entries[path]
+            self._total -= size
+
+# Singleton Instance
+ocr_cache = OCRCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import sqlite3
+
+# Match confirmations waiting for Confirm / Reject, so their buttons keep working after a restart.
+PENDING_DB_PATH = os.getenv("PENDING_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "pending_confirmations.db"))
+
+class PendingStore:
+    """
+    Small local SQLite table keyed by the confirmation message id. Writes are a
+    single row each (tiny, local), so they're done inline.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_confirmations (
+                    message_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER,
+                    guild_id INTEGER,
+                    lobby_id INTEGER,
+                    match_no INTEGER,
+                    admin_id INTEGER,
+                    existing_match_id INTEGER,
+                    stats_data TEXT,
+                    image_urls TEXT,
+                    created_at REAL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def save(self, record):
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pending_confirmations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record["message_id"], record["channel_id"], record["guild_id"],
+                    record["lobby_id"], record["match_no"], record["admin_id"], record["existing_match_id"],
+                    json.dumps(record["stats_data"]), json.dumps(record["image_urls"]),
+                    record.get("created_at") or time.time()
+                )
+            )
+            self.conn.commit()
+        except Exception as e:
+            print(f"⚠️ Could not persist pending confirmation {record.get('message_id')}: {e}")
+
+    def delete(self, message_id):
+        try:
+            self.conn.execute("DELETE FROM pending_confirmations WHERE message_id = ?", (message_id,))
+            self.conn.commit()
+        except Exception as e:
+            print(f"⚠️ Could not delete pending confirmation {message_id}: {e}")
+
+    def load_all(self):
+        try:
+            cur = self.conn.execute("SELECT * FROM pending_confirmations ORDER BY created_at")
+        except Exception as e:
+            print(f"⚠️ Could not load pending confirmations: {e}")
+            return []
+        columns = [c[0] for c in cur.description]
+        records = []
+        for row in cur.fetchall():
+            record = dict(zip(columns, row))
+            record["stats_data"] = json.loads(record["stats_data"] or "[]")
+            record["image_urls"] = json.loads(record["image_urls"] or "[]")
+            records.append(record)
+        return records
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+# Singleton Instance
+pending_store = PendingStore(PENDING_DB_PATH)
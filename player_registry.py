@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+from database import db
+from matching import normalize_spaced, normalize_strict, FuzzyMatcher
+
+# Seconds between incremental syncs (new rows only, by id watermark)
+PLAYERS_SYNC_INTERVAL = int(os.getenv("PLAYERS_SYNC_INTERVAL", "60"))
+# Seconds between full reloads (picks up edited/deleted rows, which the watermark can't see).
+# Run by a background loop (see the Matches cog), never from a command.
+PLAYERS_FULL_SYNC_INTERVAL = int(os.getenv("PLAYERS_FULL_SYNC_INTERVAL", "21600"))
+
+class _PlayerIndex:
+    # Lookup tables for one snapshot of the players table. Every key keeps the
+    # lowest-id row, like the first-row-wins DB queries it replaces.
+    def __init__(self):
+        self.watermark = 0 # highest players.id indexed so far
+        self.count = 0
+        self.exact = {} # ign -> discord_id
+        self.lower = {} # ign.lower() -> discord_id
+        self.spaced = {}
+        self.strict = {}
+        self.fuzzy = FuzzyMatcher([])
+
+    def add(self, player_id, discord_id, ign):
+        self.watermark = max(self.watermark, player_id)
+        self.count += 1
+        if not ign: return
+        self.exact.setdefault(ign, discord_id)
+        self.lower.setdefault(ign.lower(), discord_id)
+        spaced = normalize_spaced(ign)
+        if spaced: self.spaced.setdefault(spaced, discord_id)
+        strict = normalize_strict(ign)
+        if strict: self.strict.setdefault(strict, discord_id)
+        self.fuzzy.add(discord_id, ign)
+
+class PlayerRegistry:
+    """
+    In-memory mirror of the global `players` table (discord_id, ign), indexed for the
+    IGN -> discord_id fallback in match confirmation.
+    """
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.index = _PlayerIndex()
+        self._last_sync = 0
+        self._last_full_sync = None
+
+    async def sync(self, force=False):
+        """
+        Pulls new players since the last sync (id watermark). Cheap no-op while still
+        fresh, and before the first reload() so a command never downloads the whole table.
+        """
+        if self._last_full_sync is None: return
+        if not force and time.monotonic() - self._last_sync < PLAYERS_SYNC_INTERVAL:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_sync < PLAYERS_SYNC_INTERVAL:
+                return
+            try:
+                await self._load(self.index)
+                self._last_sync = now
+            except Exception as e:
+                print(f"Player registry sync failed: {e}")
+
+    async def reload(self):
+        """Full reload of the players table (background loop only)."""
+        async with self._lock:
+            now = time.monotonic()
+            # Built aside and swapped in, so lookups never see a half-loaded index
+            index = _PlayerIndex()
+            try:
+                await self._load(index)
+                self.index = index
+                self._last_sync = self._last_full_sync = now
+                print(f"✅ Player registry loaded: {index.count} players")
+            except Exception as e:
+                print(f"Player registry reload failed: {e}")
+
+    async def _load(self, index):
+        while True:
+            rows = await db.get_players_page(index.watermark)
+            if not rows: break
+            for player_id, discord_id, ign in rows:
+                index.add(player_id, discord_id, ign)
+
+    def get_by_ign(self, ign):
+        """Exact (case-sensitive) IGN match."""
+        return self.index.exact.get(ign) if ign else None
+
+    def lookup(self, ign):
+        """Case-insensitive, then spaced / strict normalized, then fuzzy. Returns discord_id or None."""
+        if not ign: return None
+        index = self.index
+        discord_id = index.lower.get(ign.lower())
+        if not discord_id:
+            discord_id = index.spaced.get(normalize_spaced(ign))
+        if not discord_id:
+            discord_id = index.strict.get(normalize_strict(ign))
+        if not discord_id:
+            discord_id = index.fuzzy.best_match(ign)
+        return discord_id
+
+# Singleton Instance
+player_registry = PlayerRegistry()
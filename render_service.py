@@ -0,0 +1,105 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from image_gen import generate_points_table
+
+# Points tables are rendered off the event loop in a small worker pool.
+# "process" uses every core (each worker keeps its own background/font caches);
+# "thread" is lighter and still frees the loop, but Pillow's drawing holds the GIL.
+RENDER_MODE = os.getenv("RENDER_MODE", "process")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_QUEUE_MAX = int(os.getenv("RENDER_QUEUE_MAX", "8")) # waiting renders on top of the running ones
+RENDER_TIMEOUT = int(os.getenv("RENDER_TIMEOUT", "60"))
+# Extra seconds to wait past the deadline for a worker to report its own timeout
+RENDER_TIMEOUT_GRACE = int(os.getenv("RENDER_TIMEOUT_GRACE", "10"))
+
+class RenderError(Exception):
+    """Render rejected (queue full), timed out or crashed."""
+
+class RenderTimeout(RenderError):
+    """Raised inside the worker when a render passes its deadline."""
+
+def _on_deadline(signum, frame):
+    raise RenderTimeout("Points table render took too long.")
+
+def _render_with_deadline(deadline, *args):
+    # Runs in the worker. The deadline covers queueing too, so a render that waited it out
+    # is skipped; pool processes run tasks on their main thread, where SIGALRM can stop
+    # just this render without touching the pool. Threads (and Windows) can't be
+    # interrupted and run to completion.
+    remaining = deadline - time.time()
+    if remaining <= 0: raise RenderTimeout("Points table render waited too long in the queue.")
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        return generate_points_table(*args)
+    previous = signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, remaining)
+    try:
+        return generate_points_table(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class RenderService:
+    def __init__(self, mode, workers, queue_max, timeout):
+        self.mode = mode
+        self.workers = workers
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self.executor = None
+        self.pending = 0 # submitted renders whose worker hasn't finished yet (running + waiting)
+
+    def _get_executor(self):
+        if self.executor is None:
+            if self.mode == "thread":
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+            else:
+                # Spawned, not forked: the bot process already runs threads (to_thread, aiohttp DNS)
+                self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    async def render(self, lobby_name, host_name, teams_data, logo_path=None):
+        """
+        Awaitable generate_points_table -> encoded image bytes. Arguments must be plain data
+        (they're pickled for the process pool); remote logos must already be in logo_cache.
+        """
+        if self.pending >= self.workers + self.queue_max:
+            raise RenderError("Too many points tables are being generated right now. Please try again in a minute.")
+        loop = asyncio.get_running_loop()
+        try:
+            deadline = time.time() + self.timeout # wall clock: compared in the worker process
+            future = self._get_executor().submit(_render_with_deadline, deadline, lobby_name, host_name, teams_data, logo_path)
+        except BrokenProcessPool:
+            self.executor = None
+            raise RenderError("Renderer crashed. Please try again.")
+        # The slot is freed when the worker is really done, not when we stop waiting for it
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release))
+        try:
+            # shield: a timeout must not cancel the wrapper and leave the count behind
+            result = asyncio.wrap_future(future)
+            result.add_done_callback(lambda f: f.cancelled() or f.exception()) # abandoned results: no "never retrieved" noise
+            return await asyncio.wait_for(asyncio.shield(result), timeout=self.timeout + RENDER_TIMEOUT_GRACE)
+        except (RenderTimeout, asyncio.TimeoutError):
+            # Other renders keep their workers; one that overran (thread mode, or stuck in
+            # C code) keeps its slot until it finishes
+            raise RenderError(f"Points table render took longer than {self.timeout}s.")
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next render
+            self.executor = None
+            raise RenderError("Renderer crashed. Please try again.")
+
+    def _release(self):
+        self.pending -= 1
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# Singleton Instance
+render_service = RenderService(RENDER_MODE, RENDER_WORKERS, RENDER_QUEUE_MAX, RENDER_TIMEOUT)
@@ -1,4 +1,5 @@
 -- Run this in your Supabase SQL Editor to set up the database.
+-- Safe to re-run on an existing database (after updating the bot) to apply schema changes.
 
 -- 1. Server Configuration
 CREATE TABLE IF NOT EXISTS server_config (
@@ -10,9 +11,13 @@ CREATE TABLE IF NOT EXISTS server_config (
     reg_channel_id TEXT,
     host_name TEXT,
     host_logo TEXT,
+    ocr_mode TEXT DEFAULT 'batch', -- 'batch' (one AI call) or 'fanout' (one call per screenshot)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
+-- Columns added after the first release (no-ops on fresh installs)
+ALTER TABLE server_config ADD COLUMN IF NOT EXISTS ocr_mode TEXT DEFAULT 'batch';
+
 -- 2. Lobbies (Scrims)
 CREATE TABLE IF NOT EXISTS lobbies (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
@@ -88,6 +93,18 @@ CREATE TABLE IF NOT EXISTS player_stats (
     UNIQUE(discord_id, guild_id)
 );
 
+-- 9. Lobby Standings (Materialized per-team totals, kept up to date by save_match_results)
+CREATE TABLE IF NOT EXISTS lobby_standings (
+    lobby_id BIGINT REFERENCES lobbies(id) ON DELETE CASCADE,
+    team_id BIGINT REFERENCES teams(id) ON DELETE CASCADE,
+    matches INTEGER DEFAULT 0,
+    booyahs INTEGER DEFAULT 0,
+    placement_points INTEGER DEFAULT 0,
+    kills INTEGER DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL,
+    PRIMARY KEY (lobby_id, team_id)
+);
+
 -- Enable Row Level Security (RLS) is recommended by Supabase, 
 -- but for a bot handling everything via Service Role Key (or simple API), it's not strictly required unless you have a frontend.
 -- Enabling it but allowing all access for anon/service_role for now to avoid permission issues.
@@ -99,13 +116,165 @@ ALTER TABLE players ENABLE ROW LEVEL SECURITY;
 ALTER TABLE matches ENABLE ROW LEVEL SECURITY;
 ALTER TABLE match_results ENABLE ROW LEVEL SECURITY;
 ALTER TABLE player_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE lobby_standings ENABLE ROW LEVEL SECURITY;
 
 -- Policy to allow full access (Modify if you want specific rules)
+-- Dropped first so this file can be re-run on an existing database to pick up new tables/functions.
+DROP POLICY IF EXISTS "Enable all access" ON server_config;
 CREATE POLICY "Enable all access" ON server_config FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON lobbies;
 CREATE POLICY "Enable all access" ON lobbies FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON teams;
 CREATE POLICY "Enable all access" ON teams FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON team_players;
 CREATE POLICY "Enable all access" ON team_players FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON players;
 CREATE POLICY "Enable all access" ON players FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON matches;
 CREATE POLICY "Enable all access" ON matches FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON match_results;
 CREATE POLICY "Enable all access" ON match_results FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON player_stats;
 CREATE POLICY "Enable all access" ON player_stats FOR ALL USING (true) WITH CHECK (true);
+DROP POLICY IF EXISTS "Enable all access" ON lobby_standings;
+CREATE POLICY "Enable all access" ON lobby_standings FOR ALL USING (true) WITH CHECK (true);
+
+
+-- 10. Standings Maintenance
+-- p_placement_points[n] = points for finishing position n (1-based, from config.PLACEMENT_POINTS).
+-- A team's position in a match is its best (lowest) recorded player position.
+-- p_sign = 1 adds a match's results to lobby_standings, -1 takes them back out (used when editing).
+CREATE OR REPLACE FUNCTION apply_match_to_standings(
+    p_match_id BIGINT,
+    p_sign INTEGER,
+    p_placement_points INTEGER[]
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO lobby_standings AS ls (lobby_id, team_id, matches, booyahs, placement_points, kills)
+    SELECT t.lobby_id, mr.team_id,
+        p_sign,
+        p_sign * (CASE WHEN MIN(mr.position) = 1 THEN 1 ELSE 0 END),
+        p_sign * COALESCE(p_placement_points[MIN(mr.position)], 0),
+        p_sign * COALESCE(SUM(mr.kills), 0)
+    FROM match_results mr
+    JOIN teams t ON t.id = mr.team_id
+    WHERE mr.match_id = p_match_id
+    GROUP BY t.lobby_id, mr.team_id
+    ON CONFLICT (lobby_id, team_id) DO UPDATE SET
+        matches = ls.matches + EXCLUDED.matches,
+        booyahs = ls.booyahs + EXCLUDED.booyahs,
+        placement_points = ls.placement_points + EXCLUDED.placement_points,
+        kills = ls.kills + EXCLUDED.kills,
+        updated_at = timezone('utc'::text, now());
+END;
+$$;
+
+-- Recomputes a lobby's standings from match_results.
+CREATE OR REPLACE FUNCTION rebuild_lobby_standings(
+    p_lobby_id BIGINT,
+    p_placement_points INTEGER[]
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_match_id BIGINT;
+BEGIN
+    DELETE FROM lobby_standings WHERE lobby_id = p_lobby_id;
+    FOR v_match_id IN SELECT id FROM matches WHERE lobby_id = p_lobby_id LOOP
+        PERFORM apply_match_to_standings(v_match_id, 1, p_placement_points);
+    END LOOP;
+END;
+$$;
+
+-- Backfills lobbies whose matches were saved before lobby_standings existed
+-- (matches but no standings rows). Called on every save and read, so no manual step.
+CREATE OR REPLACE FUNCTION ensure_lobby_standings(
+    p_lobby_id BIGINT,
+    p_placement_points INTEGER[]
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM lobby_standings WHERE lobby_id = p_lobby_id)
+       AND EXISTS (SELECT 1 FROM matches WHERE lobby_id = p_lobby_id) THEN
+        PERFORM rebuild_lobby_standings(p_lobby_id, p_placement_points);
+    END IF;
+END;
+$$;
+
+-- 11. Atomic Match Save (match row + all player results + standings in a single request/transaction)
+-- Pass p_match_id to replace the results of an existing match instead of creating a new one.
+-- Replaces the earlier version without p_placement_points (it didn't update lobby_standings)
+DROP FUNCTION IF EXISTS save_match_results(TEXT, BIGINT, INTEGER, JSONB, BIGINT);
+CREATE OR REPLACE FUNCTION save_match_results(
+    p_guild_id TEXT,
+    p_lobby_id BIGINT,
+    p_match_no INTEGER,
+    p_results JSONB,
+    p_placement_points INTEGER[],
+    p_match_id BIGINT DEFAULT NULL
+) RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_match_id BIGINT := p_match_id;
+BEGIN
+    -- Old matches first, otherwise the new one would be the lobby's only standings contribution
+    PERFORM ensure_lobby_standings(p_lobby_id, p_placement_points);
+
+    IF v_match_id IS NULL THEN
+        INSERT INTO matches (guild_id, lobby_id, match_no, confirmed)
+        VALUES (p_guild_id, p_lobby_id, p_match_no, 1)
+        RETURNING id INTO v_match_id;
+    ELSE
+        PERFORM apply_match_to_standings(v_match_id, -1, p_placement_points);
+        DELETE FROM match_results WHERE match_id = v_match_id;
+    END IF;
+
+    INSERT INTO match_results (match_id, team_id, player_ign, player_discord_id, kills, position)
+    SELECT v_match_id, r.team_id, r.player_ign, r.player_discord_id, r.kills, r.position
+    FROM jsonb_to_recordset(p_results) AS r(team_id BIGINT, player_ign TEXT, player_discord_id TEXT, kills INTEGER, position INTEGER);
+
+    PERFORM apply_match_to_standings(v_match_id, 1, p_placement_points);
+
+    RETURN v_match_id;
+END;
+$$;
+
+-- 12. Lobby Standings Read (one row per team, straight from lobby_standings)
+-- Replaces the earlier versions; left in place, PostgREST can't tell them apart by argument names
+DROP FUNCTION IF EXISTS get_lobby_standings(BIGINT, INTEGER[], INTEGER);
+DROP FUNCTION IF EXISTS get_lobby_standings(BIGINT, INTEGER);
+CREATE OR REPLACE FUNCTION get_lobby_standings(
+    p_lobby_id BIGINT,
+    p_kill_points INTEGER DEFAULT 1,
+    p_placement_points INTEGER[] DEFAULT NULL
+) RETURNS TABLE (
+    team_id BIGINT,
+    team_name TEXT,
+    slot_no INTEGER,
+    matches INTEGER,
+    booyahs INTEGER,
+    placement_points INTEGER,
+    kills INTEGER,
+    total INTEGER
+)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+    IF p_placement_points IS NOT NULL THEN
+        PERFORM ensure_lobby_standings(p_lobby_id, p_placement_points);
+    END IF;
+
+    RETURN QUERY
+    SELECT t.id, t.team_name, t.slot_no,
+        COALESCE(ls.matches, 0),
+        COALESCE(ls.booyahs, 0),
+        COALESCE(ls.placement_points, 0),
+        COALESCE(ls.kills, 0),
+        COALESCE(ls.kills * p_kill_points + ls.placement_points, 0)
+    FROM teams t
+    LEFT JOIN lobby_standings ls ON ls.lobby_id = t.lobby_id AND ls.team_id = t.id
+    WHERE t.lobby_id = p_lobby_id
+    ORDER BY t.slot_no;
+END;
+$$;
+
@@ -1,4 +1,4 @@
-from image_gen import generate_points_table
+from image_gen import generate_points_table, POINTS_TABLE_FILENAME
 import os
 
 # Sample data for 12 teams to verify full layout
@@ -18,9 +18,12 @@ if __name__ == "__main__":
         {"team": "Iron Legit", "matches": 4, "booyah": 0, "kills": 10, "pts": 40}
     ]
     
-    output = generate_points_table(
+    data = generate_points_table(
         lobby_name="PMGC Scrims - Day 3",
         host_name="GamingHub",
         teams_data=sample_data
     )
-    print(f"Points table generated: {output}")
\ No newline at end of file
+    output = POINTS_TABLE_FILENAME
+    with open(output, "wb") as f:
+        f.write(data)
+    print(f"Points table generated: {output} ({len(data) / 1024:.0f} KB)")
\ No newline at end of file
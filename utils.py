@@ -1,33 +1,68 @@
 from database import db
+from config import ATTACHMENT_MAX_BYTES, ATTACHMENT_TIMEOUT
 import discord
+import aiohttp
+import asyncio
 
-def get_scrim_admin_role(guild_id: int):
+async def get_scrim_admin_role(guild_id: int):
     """Retrieves the scrim admin role ID for a guild."""
-    config = db.get_config(guild_id)
-    # config: guild_id, role, time, staff, results, reg, host, logo
+    config = await db.get_config(guild_id)
+    # config: guild_id, role, time, staff, results, reg, host, logo, ocr_mode
     if config and config[1]:
         return int(config[1])
     return None
 
-def get_config(guild_id: int):
+async def get_config(guild_id: int):
     """Retrieves the configuration for a guild."""
-    config = db.get_config(guild_id)
+    config = await db.get_config(guild_id)
     if config:
         return {
             "role_id": int(config[1]) if config[1] else None,
             "staff_channel_id": int(config[3]) if config[3] else None,
             "results_channel_id": int(config[4]) if config[4] else None,
-            "reg_channel_id": int(config[5]) if config[5] else None
+            "reg_channel_id": int(config[5]) if config[5] else None,
+            "ocr_mode": config[8]
         }
     return None
 
-def is_scrim_admin(member: discord.Member):
+async def is_scrim_admin(member: discord.Member):
     """Checks if a member has the scrim admin role."""
     if member.guild_permissions.administrator:
         return True
         
-    role_id = get_scrim_admin_role(member.guild.id)
+    role_id = await get_scrim_admin_role(member.guild.id)
     if not role_id:
         return False
         
     return any(role.id == role_id for role in member.roles)
+
+
+class AttachmentDownloadError(Exception):
+    """An attachment couldn't be downloaded (bad status, too large, or timed out)."""
+
+async def _download(session: aiohttp.ClientSession, url, filename, content_type=None):
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=ATTACHMENT_TIMEOUT)) as resp:
+            if resp.status != 200:
+                raise AttachmentDownloadError(f"Could not download {filename} (HTTP {resp.status}).")
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                data.extend(chunk)
+                if len(data) > ATTACHMENT_MAX_BYTES:
+                    raise AttachmentDownloadError(f"{filename} is larger than {ATTACHMENT_MAX_BYTES // (1024 * 1024)} MB.")
+            return bytes(data), content_type or resp.content_type
+    except asyncio.TimeoutError:
+        raise AttachmentDownloadError(f"Timed out downloading {filename}.")
+
+async def _download_attachment(session: aiohttp.ClientSession, attachment: discord.Attachment):
+    if attachment.size and attachment.size > ATTACHMENT_MAX_BYTES:
+        raise AttachmentDownloadError(f"{attachment.filename} is larger than {ATTACHMENT_MAX_BYTES // (1024 * 1024)} MB.")
+    return await _download(session, attachment.url, attachment.filename, attachment.content_type)
+
+async def download_attachments(session: aiohttp.ClientSession, attachments):
+    """Downloads attachments concurrently. Returns [(bytes, mime_type), ...] in the same order."""
+    return list(await asyncio.gather(*(_download_attachment(session, a) for a in attachments)))
+
+async def download_urls(session: aiohttp.ClientSession, urls):
+    """Same as download_attachments, from saved attachment URLs (mime type taken from the response)."""
+    return list(await asyncio.gather(*(_download(session, url, f"screenshot {i}") for i, url in enumerate(urls, 1))))
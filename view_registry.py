@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from pending_store import pending_store
+
+# Unanswered match confirmations are capped per server and expire with age;
+# evicted ones get their buttons disabled.
+VIEW_MAX_PER_GUILD = int(os.getenv("VIEW_MAX_PER_GUILD", "10"))
+VIEW_MAX_AGE = int(os.getenv("VIEW_MAX_AGE", str(24 * 3600)))
+# In-memory screenshots are dropped after this long; a re-scan downloads them again
+VIEW_IMAGE_TTL = int(os.getenv("VIEW_IMAGE_TTL", str(15 * 60)))
+
+class ViewRegistry:
+    """
+    Tracks live MatchConfirmationViews by guild (oldest first). Views are added
+    when their message is sent and removed on Confirm / Reject or eviction.
+    """
+    def __init__(self, max_per_guild, max_age, image_ttl):
+        self.max_per_guild = max_per_guild
+        self.max_age = max_age
+        self.image_ttl = image_ttl
+        self.guilds = {} # guild_id -> OrderedDict(message_id -> view)
+        self.bot = None
+        self._tasks = set()
+
+    def bind(self, bot):
+        self.bot = bot
+
+    def register(self, view):
+        views = self.guilds.setdefault(view.guild_id, OrderedDict())
+        views[view.message_id] = view
+        while len(views) > self.max_per_guild:
+            _, oldest = views.popitem(last=False)
+            self._spawn(self._evict(oldest, "⌛ Too many pending confirmations in this server; this one was closed."))
+
+    def unregister(self, view):
+        views = self.guilds.get(view.guild_id)
+        if views is None: return
+        views.pop(view.message_id, None)
+        if not views: del self.guilds[view.guild_id]
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _evict(self, view, reason):
+        view.stop()
+        pending_store.delete(view.message_id)
+        for child in view.children:
+            child.disabled = True
+        if self.bot: await self.bot.wait_until_ready() # evictions at startup wait for the channel cache
+        channel = self.bot.get_channel(view.channel_id) if self.bot else None
+        if channel is None: return
+        try:
+            await channel.get_partial_message(view.message_id).edit(content=f"{reason} Submit the match again if needed.", view=view)
+        except Exception as e:
+            print(f"[VIEWS] Could not disable buttons on {view.message_id}: {e}")
+
+    async def sweep(self):
+        """Evicts expired views and frees old screenshots. Run periodically."""
+        now = time.time()
+        expired = []
+        for views in self.guilds.values():
+            for view in views.values():
+                age = now - (view.created_at or now)
+                if age > self.max_age:
+                    expired.append(view)
+                elif age > self.image_ttl and view.images and view.image_urls:
+                    view.images = []
+        for view in expired:
+            self.unregister(view)
+            await self._evict(view, "⌛ This confirmation expired.")
+        live, retained = self.gauge()
+        print(f"[VIEWS] {live} pending confirmation(s), ~{retained / 1024:.0f} KB retained, {len(expired)} expired")
+
+    def gauge(self):
+        """-> (live views, approximate bytes held by their screenshots and stats)."""
+        live = 0
+        retained = 0
+        for views in self.guilds.values():
+            for view in views.values():
+                live += 1
+                retained += sum(len(d) for d, _ in view.images)
+                retained += len(json.dumps(view.stats_data))
+        return live, retained
+
+# Singleton Instance
+view_registry = ViewRegistry(VIEW_MAX_PER_GUILD, VIEW_MAX_AGE, VIEW_IMAGE_TTL)